@@ -0,0 +1,445 @@
+"""
+In-process stand-in for polyinterface and the Polyglot MQTT broker, so the
+node server can be run and measured without Polyglot or an ISY.
+
+Node and Controller behave like polyinterface 2.1. Interface keeps what
+Polyglot would keep (nodes and their driver values, custom params, notices),
+answers addnode with a result message the way Polyglot does, and counts every
+message sent.
+
+    import fakepoly
+    fakepoly.install()        # before anything imports polyinterface
+    from nodes import TemplateController
+"""
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+import types
+from copy import deepcopy
+
+class PolyLogger(object):
+    def __init__(self, path=os.devnull):
+        self.handler = logging.FileHandler(path)
+        self.logger = logging.getLogger('polyinterface')
+        self.logger.propagate = False
+        self.logger.addHandler(self.handler)
+        self.logger.setLevel(logging.WARNING)
+        self.warnlog = logging.getLogger('py.warnings')
+
+    def set_log_format(self, fmt_string):
+        self.handler.setFormatter(logging.Formatter(fmt_string))
+
+    def set_basic_config(self, enable=True, level=None):
+        for handler in logging.root.handlers[:]:
+            logging.root.removeHandler(handler)
+        if enable:
+            logging.basicConfig(handlers=[self.handler], level=level or logging.WARNING)
+
+LOG_HANDLER = PolyLogger()
+LOGGER = LOG_HANDLER.logger
+
+class Interface(object):
+    """
+    Polyglot and the MQTT broker. Messages sent by the node server are handled
+    right away on the sending thread, results come back through inQueue.
+    """
+    def __init__(self, envVar=None, latency=0):
+        """
+        :param latency: Seconds each send() blocks, to simulate a slow broker
+        """
+        self.latency = latency
+        self.inQueue = queue.Queue()
+        self.network_interface = {'addr': '127.0.0.1'}
+        self.config = {
+            'nodes': [],
+            'customParams': {},
+            'customData': {},
+            'notices': {},
+            'typedParams': [],
+            'isyVersion': '5.0.16',
+        }
+        self.messages = 0
+        self.counts = {}
+        self._lock = threading.Lock()
+        self._configObservers = []
+        self._stopObservers = []
+
+    def onConfig(self, callback):
+        self._configObservers.append(callback)
+
+    def onStop(self, callback):
+        self._stopObservers.append(callback)
+
+    def start(self):
+        pass
+
+    def stop(self):
+        for watcher in self._stopObservers:
+            watcher()
+
+    def inConfig(self, config=None):
+        if config is not None:
+            self.config = config
+        for watcher in self._configObservers:
+            watcher(self.config)
+
+    def send(self, message):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            self.messages += 1
+            for key in message:
+                self.counts[key] = self.counts.get(key, 0) + 1
+            self._polyglot(message)
+
+    def _node(self, address):
+        for node in self.config['nodes']:
+            if node['address'] == address:
+                return node
+        return None
+
+    def _polyglot(self, message):
+        # What Polyglot does with each message
+        if 'addnode' in message:
+            for n in message['addnode']['nodes']:
+                node = self._node(n['address'])
+                if node is None:
+                    node = {'address': n['address'], 'isprimary': False,
+                            'timeAdded': int(time.time()), 'enabled': True, 'added': True}
+                    self.config['nodes'].append(node)
+                node.update({'name': n['name'], 'node_def_id': n['node_def_id'],
+                             'drivers': deepcopy(n['drivers'])})
+                self.inQueue.put({'result': {'addnode': {'success': True, 'address': n['address']}}})
+        elif 'removenode' in message:
+            node = self._node(message['removenode']['address'])
+            if node is not None:
+                self.config['nodes'].remove(node)
+        elif 'status' in message:
+            status = message['status']
+            node = self._node(status['address'])
+            if node is not None:
+                for driver in node['drivers']:
+                    if driver['driver'] == status['driver']:
+                        driver['value'] = status['value']
+                        driver['uom'] = status['uom']
+        elif 'customparams' in message:
+            self.config['customParams'] = deepcopy(message['customparams'])
+        elif 'customdata' in message:
+            self.config['customData'] = deepcopy(message['customdata'])
+        elif 'addnotice' in message:
+            self.config['notices'][message['addnotice']['key']] = message['addnotice']['value']
+        elif 'removenotice' in message:
+            self.config['notices'].pop(message['removenotice']['key'], None)
+        elif 'typedparams' in message:
+            self.config['typedParams'] = deepcopy(message['typedparams'])
+
+    def addNode(self, node):
+        self.send({'addnode': {'nodes': [{
+            'address': node.address, 'name': node.name, 'node_def_id': node.id,
+            'primary': node.primary, 'drivers': node.drivers, 'hint': node.hint}]}})
+
+    def delNode(self, address):
+        self.send({'removenode': {'address': address}})
+
+    def saveCustomData(self, data):
+        self.send({'customdata': data})
+
+    def saveCustomParams(self, data):
+        self.send({'customparams': data})
+
+    def addNotice(self, data):
+        self.send({'addnotice': data})
+
+    def removeNotice(self, data):
+        self.send({'removenotice': data})
+
+    def restart(self):
+        self.send({'restart': {}})
+
+    def installprofile(self):
+        self.send({'installprofile': {'reboot': False}})
+
+    def save_typed_params(self, data):
+        self.send({'typedparams': data if isinstance(data, list) else [data]})
+
+    def add_custom_config_docs(self, data, clearCurrentData=False):
+        self.send({'customparamsdoc': data})
+
+    def get_server_data(self, check_profile=True, build_profile=None):
+        return {'version': 'bench', 'profile_version': 'bench'}
+
+    def get_network_interface(self, interface='default'):
+        return self.network_interface
+
+class Node(object):
+    def __init__(self, controller, primary, address, name):
+        self.controller = controller
+        self.parent = self.controller
+        self.primary = primary
+        self.address = address
+        self.name = name
+        self.polyConfig = None
+        self.drivers = deepcopy(self.drivers)
+        self._drivers = deepcopy(self.drivers)
+        self.isPrimary = None
+        self.config = None
+        self.timeAdded = None
+        self.enabled = None
+        self.added = None
+
+    def setDriver(self, driver, value, report=True, force=False, uom=None):
+        for d in self.drivers:
+            if d['driver'] == driver:
+                d['value'] = value
+                if uom is not None:
+                    d['uom'] = uom
+                if report:
+                    self.reportDriver(d, report, force)
+                break
+
+    def reportDriver(self, driver, report, force):
+        for d in self._drivers:
+            if (d['driver'] == driver['driver'] and
+                (str(d['value']) != str(driver['value']) or
+                    d['uom'] != driver['uom'] or force)):
+                d['value'] = deepcopy(driver['value'])
+                d['uom'] = deepcopy(driver['uom'])
+                self.controller.poly.send({'status': {
+                    'address': self.address, 'driver': driver['driver'],
+                    'value': str(driver['value']), 'uom': driver['uom']}})
+                break
+
+    def reportCmd(self, command, value=None, uom=None):
+        message = {'command': {'address': self.address, 'command': command}}
+        if value is not None and uom is not None:
+            message['command']['value'] = str(value)
+            message['command']['uom'] = uom
+        self.controller.poly.send(message)
+
+    def reportDrivers(self):
+        self.updateDrivers(self.drivers)
+        for driver in self.drivers:
+            self.controller.poly.send({'status': {
+                'address': self.address, 'driver': driver['driver'],
+                'value': driver['value'], 'uom': driver['uom']}})
+
+    def updateDrivers(self, drivers):
+        self._drivers = deepcopy(drivers)
+
+    def query(self):
+        self.reportDrivers()
+
+    def status(self):
+        self.reportDrivers()
+
+    def runCmd(self, command):
+        if command['cmd'] in self.commands:
+            fun = self.commands[command['cmd']]
+            fun(self, command)
+
+    def start(self):
+        pass
+
+    def getDriver(self, dv):
+        for node in self.controller.poly.config['nodes']:
+            if node['address'] == self.address:
+                for driver in node['drivers']:
+                    if driver['driver'] == dv:
+                        return driver['value']
+        return None
+
+    id = ''
+    commands = {}
+    drivers = []
+    sends = {}
+    hint = [0, 0, 0, 0]
+
+class Controller(Node):
+    def __init__(self, poly, name='Controller'):
+        self.controller = self
+        self.parent = self.controller
+        self.poly = poly
+        self.poly.onConfig(self._gotConfig)
+        self.poly.onStop(self.stop)
+        self.name = name
+        self.address = 'controller'
+        self.primary = self.address
+        self._drivers = deepcopy(self.drivers)
+        self._nodes = {}
+        self.config = None
+        self.nodes = {self.address: self}
+        self._threads = {}
+        self._threads['input'] = threading.Thread(target=self._parseInput, name='Controller')
+        self._threads['ns'] = threading.Thread(target=self.start, name='NodeServer')
+        self.polyConfig = None
+        self.isPrimary = None
+        self.timeAdded = None
+        self.enabled = None
+        self.added = None
+        self.started = False
+        self.nodesAdding = []
+        self._threads['input'].daemon = True
+        self._threads['ns'].daemon = True
+        self._threads['input'].start()
+
+    def _gotConfig(self, config):
+        self.polyConfig = config
+        for node in config['nodes']:
+            self._nodes[node['address']] = node
+            if node['address'] in self.nodes:
+                n = self.nodes[node['address']]
+                n.updateDrivers(node['drivers'])
+                n.config = node
+                n.isPrimary = node['isprimary']
+                n.timeAdded = node['timeAdded']
+                n.enabled = node['enabled']
+                n.added = node['added']
+        if self.address not in self._nodes:
+            self.addNode(self)
+        if not self.started:
+            self.nodes[self.address] = self
+            self.started = True
+            self._threads['ns'].start()
+
+    def _parseInput(self):
+        while True:
+            input = self.poly.inQueue.get()
+            if input is None:
+                break
+            for key in input:
+                if key == 'command':
+                    if input[key]['address'] in self.nodes:
+                        try:
+                            self.nodes[input[key]['address']].runCmd(input[key])
+                        except Exception as err:
+                            LOGGER.error('_parseInput: failed %s', err, exc_info=True)
+                elif key == 'result':
+                    self._handleResult(input[key])
+                elif key == 'shortPoll':
+                    self.shortPoll()
+                elif key == 'longPoll':
+                    self.longPoll()
+                elif key == 'query':
+                    if input[key]['address'] in self.nodes:
+                        self.nodes[input[key]['address']].query()
+                    elif input[key]['address'] == 'all':
+                        self.query()
+                elif key == 'status':
+                    if input[key]['address'] in self.nodes:
+                        self.nodes[input[key]['address']].status()
+                    elif input[key]['address'] == 'all':
+                        self.status()
+            self.poly.inQueue.task_done()
+
+    def _handleResult(self, result):
+        if 'addnode' in result:
+            address = result['addnode']['address']
+            if result['addnode']['success']:
+                if address != self.address and address in self.nodes:
+                    self.nodes[address].start()
+                if address in self.nodesAdding:
+                    self.nodesAdding.remove(address)
+            else:
+                self.nodes.pop(address, None)
+
+    def addNode(self, node, update=False):
+        if node.address in self._nodes:
+            node._drivers = self._nodes[node.address]['drivers']
+            for driver in node.drivers:
+                for existing in self._nodes[node.address]['drivers']:
+                    if driver['driver'] == existing['driver']:
+                        driver['value'] = existing['value']
+        self.nodes[node.address] = node
+        self.nodesAdding.append(node.address)
+        self.poly.addNode(node)
+        return node
+
+    def updateNode(self, node):
+        self.nodes[node.address] = node
+        self.nodesAdding.append(node.address)
+        self.poly.addNode(node)
+
+    def delNode(self, address):
+        if address in self.nodes:
+            del self.nodes[address]
+        self.poly.delNode(address)
+
+    def longPoll(self):
+        pass
+
+    def shortPoll(self):
+        pass
+
+    def query(self):
+        for node in self.nodes:
+            self.nodes[node].reportDrivers()
+
+    def status(self):
+        for node in self.nodes:
+            self.nodes[node].reportDrivers()
+
+    def runForever(self):
+        self._threads['input'].join()
+
+    def start(self):
+        pass
+
+    def saveCustomData(self, data):
+        self.poly.saveCustomData(data)
+
+    def addCustomParam(self, data):
+        newData = deepcopy(self.poly.config['customParams'])
+        newData.update(data)
+        self.poly.saveCustomParams(newData)
+
+    def removeCustomParam(self, data):
+        newData = deepcopy(self.poly.config['customParams'])
+        newData.pop(data, None)
+        self.poly.saveCustomParams(newData)
+
+    def getCustomParam(self, data):
+        return deepcopy(self.poly.config['customParams']).get(data)
+
+    def addNotice(self, data, key=None):
+        if not isinstance(data, dict):
+            self.poly.addNotice({'key': key, 'value': data})
+        elif 'value' in data:
+            self.poly.addNotice(data)
+        else:
+            for key, value in data.items():
+                self.poly.addNotice({'key': key, 'value': value})
+
+    def removeNotice(self, key):
+        self.poly.removeNotice({'key': str(key)})
+
+    def getNotices(self):
+        return self.poly.config['notices']
+
+    def removeNoticesAll(self):
+        for key in list(self.poly.config['notices'].keys()):
+            self.removeNotice(key)
+
+    def stop(self):
+        pass
+
+    id = 'controller'
+    commands = {}
+    drivers = [{'driver': 'ST', 'value': 0, 'uom': 2}]
+
+def install(log_path=os.devnull):
+    """
+    Register this module as polyinterface, logging to log_path.
+    """
+    module = types.ModuleType('polyinterface')
+    LOG_HANDLER.handler.close()
+    LOG_HANDLER.logger.removeHandler(LOG_HANDLER.handler)
+    LOG_HANDLER.handler = logging.FileHandler(log_path)
+    LOG_HANDLER.logger.addHandler(LOG_HANDLER.handler)
+    for name in ('LOG_HANDLER', 'LOGGER', 'Interface', 'Node', 'Controller'):
+        setattr(module, name, globals()[name])
+    module.__version__ = '2.1.0-bench'
+    sys.modules['polyinterface'] = module
+    return module
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+Compares one urllib3.PoolManager per node (the old TemplateNode.start) with
+the controller's shared HttpPool against a local HTTP server. The shared
+pool uses TemplateController.http_pool and polls run on poll_workers
+threads, as they do in the node server.
+
+    python bench/http_pool.py --nodes 500 --requests 4
+
+Reports the number of TCP connections the server accepted and the request
+latency for each setup, the median of --runs runs.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
+
+import urllib3
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH)
+sys.path.insert(0, os.path.dirname(BENCH))
+# The controller's settings, with the fake Polyglot standing in for polyinterface
+import fakepoly
+fakepoly.install()
+from nodes import TemplateController
+from nodes.HttpPool import HttpPool
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Buffer so headers and body go out in one segment
+    wbufsize = 65536
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super(Handler, self).setup()
+        with Handler.lock:
+            Handler.connections += 1
+
+    def do_GET(self):
+        body = b'ok'
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def run(label, make_pools, url, nodes, requests, workers, runs):
+    results = []
+    for _ in range(runs):
+        results.append(run_once(make_pools(), url, nodes, requests, workers))
+    connections, elapsed, p50, p99 = sorted(results, key=lambda r: r[1])[len(results) // 2]
+    print('{:<10} connections={:<6} total={:7.3f}s  p50={:6.2f}ms  p99={:6.2f}ms'.format(
+        label, connections, elapsed, p50 * 1000, p99 * 1000))
+
+def run_once(pools, url, nodes, requests, workers):
+    Handler.connections = 0
+    latencies = []
+    def node_poll(i):
+        pool = pools[i % len(pools)]
+        for _ in range(requests):
+            st = time.perf_counter()
+            pool.request('GET', url).data
+            latencies.append(time.perf_counter() - st)
+    st = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        list(ex.map(node_poll, range(nodes)))
+    elapsed = time.perf_counter() - st
+    latencies.sort()
+    for pool in pools:
+        pool.clear()
+    return (Handler.connections, elapsed, latencies[len(latencies) // 2],
+            latencies[int(len(latencies) * 0.99)])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--nodes', type=int, default=500)
+    parser.add_argument('--requests', type=int, default=4, help='requests per node')
+    parser.add_argument('--workers', type=int, default=TemplateController.poll_workers, help='concurrent pollers')
+    parser.add_argument('--runs', type=int, default=5, help='runs of each setup, the median is shown')
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = 'http://127.0.0.1:{}/'.format(server.server_address[1])
+
+    print('shared pool settings: {}'.format(TemplateController.http_pool))
+    run('per-node', lambda: [urllib3.PoolManager() for _ in range(args.nodes)],
+        url, args.nodes, args.requests, args.workers, args.runs)
+    run('shared', lambda: [HttpPool(**TemplateController.http_pool)],
+        url, args.nodes, args.requests, args.workers, args.runs)
+    server.shutdown()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+"""
+Load test for the node server without Polyglot or an ISY.
+
+    python bench/load.py                          # 10, 100, 1000 and 10000 nodes
+    python bench/load.py --nodes 10 100 --out results.json
+
+Each size runs in its own process against bench/fakepoly.py, with
+TemplateController discovering that many TemplateNodes. It records startup
+time and phases, shortPoll cycle time, messages per second, command round
+trip latency, and peak RSS. All results are written as JSON to --out so runs
+of different versions can be compared.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+
+def rss_kb():
+    # Current and peak resident set size
+    rss = {}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(('VmRSS:', 'VmHWM:')):
+                    rss[line.split(':')[0]] = int(line.split()[1])
+        return rss.get('VmRSS', 0), rss.get('VmHWM', 0)
+    except (IOError, OSError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak, peak
+
+def deepsize(obj, seen=None):
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deepsize(k, seen) + deepsize(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(deepsize(v, seen) for v in obj)
+    return size
+
+def wait_for(check, timeout, interval=0.005):
+    end = time.time() + timeout
+    while not check():
+        if time.time() > end:
+            raise RuntimeError('timed out')
+        time.sleep(interval)
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))] if values else 0
+
+def run_one(count, cycles, commands, latency, compact):
+    """
+    Runs in the child process, returns the results dictionary.
+    """
+    workdir = tempfile.mkdtemp(prefix='polybench')
+    os.makedirs(os.path.join(workdir, 'logs'))
+    shutil.copy(os.path.join(ROOT, 'server.json'), workdir)
+    os.chdir(workdir)
+    sys.path.insert(0, BENCH)
+    sys.path.insert(0, ROOT)
+    import fakepoly
+    fakepoly.install(os.path.join(workdir, 'logs', 'debug.log'))
+    t0 = time.time()
+    from nodes import TemplateController
+    from nodes.StartupTimer import STARTUP
+    import_time = time.time() - t0
+    STARTUP.started = t0
+    STARTUP.mark('import')
+
+    class BenchController(TemplateController):
+        # Measure whole shortPoll cycles, not scheduler ticks
+        use_poll_scheduler = False
+        compact_nodes = compact
+        # Measure this code, not the limit kept for the ISY
+        outbound_rate = None
+        # Cycles run back to back, don't let the watchdog skip nodes
+        poll_watchdog = dict(TemplateController.poll_watchdog, max_level=0)
+        def discover_targets(self):
+            return ['n%06d' % i for i in range(count)]
+
+    poly = fakepoly.Interface('bench', latency=latency)
+    base_rss, _ = rss_kb()
+    tracemalloc.start()
+    t0 = time.time()
+    controller = BenchController(poly)
+    poly.inConfig()
+    wait_for(lambda: controller.time_to_status is not None or
+             (len(controller.nodes) > count and not controller.nodesAdding), 600)
+    startup = time.time() - t0
+    controller.batcher.flush()
+    controller.outbound.flush()
+    # Python memory held by the nodes, without the fake Polyglot's copy of them
+    node_bytes = tracemalloc.get_traced_memory()[0] - deepsize(poly.config)
+    tracemalloc.stop()
+
+    results = {
+        'nodes': count,
+        'compact': compact,
+        'bytes_per_node': int(node_bytes / count) if count else 0,
+        'import_s': round(import_time, 4),
+        'startup_s': round(startup, 4),
+        'startup_messages': poly.messages,
+    }
+
+    cycle_times = []
+    start_messages = poly.messages
+    start = time.time()
+    for _ in range(cycles):
+        t = time.time()
+        controller.shortPoll()
+        cycle_times.append(time.time() - t)
+    controller.batcher.flush()
+    controller.outbound.flush()
+    elapsed = time.time() - start
+    results['shortpoll_cycle_ms'] = {
+        'avg': round(sum(cycle_times) / len(cycle_times) * 1000, 2),
+        'max': round(max(cycle_times) * 1000, 2),
+    }
+    # Seconds from importing nodes to each startup phase, see nodes/StartupTimer.py
+    results['startup_phases'] = STARTUP.phases()
+    results['shortpoll_messages'] = poly.messages - start_messages
+    results['messages_per_s'] = round((poly.messages - start_messages) / elapsed, 1) if elapsed else 0
+
+    # Round trip from the command arriving on the input queue to the node
+    # driver changing, alternating DON/DOF over the nodes.
+    addresses = sorted(a for a in controller.nodes if a != controller.address)
+    rtts = []
+    for i in range(commands):
+        node = controller.nodes[addresses[i % len(addresses)]]
+        value = 0 if int(node.drivers[0]['value']) else 1
+        t = time.time()
+        poly.inQueue.put({'command': {'address': node.address, 'cmd': 'DON' if value else 'DOF'}})
+        wait_for(lambda: int(node.drivers[0]['value']) == value, 30, 0.0001)
+        rtts.append(time.time() - t)
+    results['command_rtt_ms'] = {
+        'p50': round(percentile(rtts, 50) * 1000, 3),
+        'p99': round(percentile(rtts, 99) * 1000, 3),
+    }
+    rss, peak = rss_kb()
+    results['rss_kb'] = rss
+    results['peak_rss_kb'] = peak
+    results['rss_kb_per_node'] = round((rss - base_rss) / float(count), 2) if count else 0
+    results['messages'] = poly.counts
+    controller.stop()
+    shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Offline load test for the node server')
+    parser.add_argument('--nodes', type=int, nargs='+', default=[10, 100, 1000, 10000])
+    parser.add_argument('--cycles', type=int, default=3, help='shortPoll cycles to time')
+    parser.add_argument('--commands', type=int, default=200, help='commands to time')
+    parser.add_argument('--latency', type=float, default=0, help='seconds added to every message sent')
+    parser.add_argument('--compact', action='store_true', help='use compact nodes (TemplateController.compact_nodes)')
+    parser.add_argument('--out', default='bench_results.json')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_one(args.nodes[0], args.cycles, args.commands, args.latency, args.compact)))
+        sys.exit(0)
+
+    results = []
+    for count in args.nodes:
+        cmd = [sys.executable, os.path.abspath(__file__), '--child', '--nodes', str(count),
+               '--cycles', str(args.cycles), '--commands', str(args.commands),
+               '--latency', str(args.latency)] + (['--compact'] if args.compact else [])
+        out = subprocess.check_output(cmd)
+        result = json.loads(out.decode('utf-8').strip().splitlines()[-1])
+        results.append(result)
+        print('{nodes:>6} nodes  startup {startup_s:8.3f}s  cycle {cycle:9.2f}ms  '
+              '{messages_per_s:>10} msg/s  cmd p50 {rtt:7.3f}ms  rss {rss_kb}kB  {bytes_per_node}B/node'.format(
+                  cycle=result['shortpoll_cycle_ms']['avg'],
+                  rtt=result['command_rtt_ms']['p50'], **result))
+    git = None
+    try:
+        git = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        pass
+    with open(args.out, 'w') as f:
+        json.dump({
+            'time': time.time(),
+            'git': git,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'results': results,
+        }, f, indent=1, sort_keys=True)
+    print('Results written to {}'.format(args.out))
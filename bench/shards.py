@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+shortPoll cycle time with node polls that keep the CPU busy, run in the
+controller's process and spread over shard worker processes
+(TemplateController.shard_workers).
+
+    python bench/shards.py --nodes 200 --work 5 --workers 0 1 2 4
+
+Worker processes import this file again to find BusyNode, so the fake
+polyinterface is installed at the top.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BENCH = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH)
+sys.path[:0] = [ROOT, BENCH]
+import fakepoly
+fakepoly.install()
+from nodes import TemplateController
+from nodes.TemplateNode import TemplateNode, CompactTemplateNode
+
+class BusyNode(CompactTemplateNode):
+    __slots__ = ()
+
+    def shortPoll(self):
+        # Milliseconds of CPU per poll, workers get it from the environment
+        end = time.thread_time() + float(os.environ.get('SHARD_BENCH_WORK', '5')) / 1000.0
+        while time.thread_time() < end:
+            pass
+        super(BusyNode, self).shortPoll()
+
+def run(count, workers, cycles):
+    class BenchController(TemplateController):
+        use_poll_scheduler = False
+        # Cycles run back to back, don't let the watchdog skip nodes
+        poll_watchdog = dict(TemplateController.poll_watchdog, max_level=0)
+        compact_nodes = True
+        compact_node_classes = {TemplateNode.id: BusyNode}
+        shard_workers = workers
+        def discover_targets(self):
+            return ['n%06d' % i for i in range(count)]
+
+    poly = fakepoly.Interface('bench')
+    controller = BenchController(poly)
+    poly.inConfig()
+    end = time.time() + 60
+    while len(controller.nodes) <= count or controller.nodesAdding:
+        if time.time() > end:
+            raise RuntimeError('timed out adding nodes')
+        time.sleep(0.01)
+    times = []
+    for _ in range(cycles):
+        t = time.time()
+        controller.shortPoll()
+        times.append(time.time() - t)
+    controller.stop()
+    return sum(times) / len(times)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Poll cycle time with shard worker processes')
+    parser.add_argument('--nodes', type=int, default=200)
+    parser.add_argument('--work', type=float, default=5, help='CPU milliseconds per node poll')
+    parser.add_argument('--workers', type=int, nargs='+', default=[0, 1, 2, 4])
+    parser.add_argument('--cycles', type=int, default=3)
+    args = parser.parse_args()
+    os.environ['SHARD_BENCH_WORK'] = str(args.work)
+    workdir = tempfile.mkdtemp(prefix='polybench')
+    os.makedirs(os.path.join(workdir, 'logs'))
+    shutil.copy(os.path.join(ROOT, 'server.json'), workdir)
+    os.chdir(workdir)
+    print('{} nodes, {}ms CPU per poll, {} cores'.format(args.nodes, args.work, os.cpu_count()))
+    for workers in args.workers:
+        cycle = run(args.nodes, workers, args.cycles)
+        print('{:>3} workers  cycle {:9.1f}ms  {:8.0f} polls/s'.format(workers, cycle * 1000, args.nodes / cycle))
+    shutil.rmtree(workdir, ignore_errors=True)
@@ -0,0 +1,136 @@
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+import queue
+import threading
+import time
+from collections import deque
+from .Metrics import Metrics
+
+LOGGER = polyinterface.LOGGER
+
+class CommandQueue(object):
+    """
+    Runs commands received from ISY on worker threads so a slow command doesn't
+    hold up the ones behind it. Commands for the same node run one at a time in
+    the order received, commands for different nodes run in parallel.
+
+    Class Methods:
+    submit(address, fun, command): Queue fun(command) for the node address. Blocks
+        up to put_timeout seconds when the queue is full, then drops the command
+        and returns False.
+    stats(): Dictionary of queue depth, rejected count and queue wait/run times in ms.
+    stop(timeout=10): Wait up to timeout seconds for the commands already
+        queued to run, then stop the worker threads. Returns the number of
+        commands that didn't run.
+    """
+    def __init__(self, workers=4, maxsize=100, put_timeout=5, metrics=None, context=None):
+        """
+        :param workers: Number of commands that can run at the same time
+        :param maxsize: Maximum number of commands waiting or running
+        :param put_timeout: Seconds submit waits for room in a full queue
+        :param metrics: Metrics to record command_wait and command_run times in
+        :param context: Function returning a context manager every command runs in
+        """
+        self.put_timeout = put_timeout
+        self.context = context
+        self.metrics = metrics if metrics is not None else Metrics()
+        self._slots = threading.BoundedSemaphore(maxsize)
+        self._lock = threading.Lock()
+        # Notified when the last queued command has run
+        self._idle = threading.Condition(self._lock)
+        # address -> deque of (fun, command, time queued), only for nodes with work
+        self._nodes = {}
+        # Addresses with queued commands and no worker on them yet
+        self._ready = queue.Queue()
+        self.depth = 0
+        self.rejected = 0
+        self.timing = {
+            'wait': {'count': 0, 'total': 0.0, 'max': 0.0},
+            'run': {'count': 0, 'total': 0.0, 'max': 0.0},
+        }
+        self._threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._worker, name='Command{}'.format(i))
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, address, fun, command):
+        if not self._slots.acquire(timeout=self.put_timeout):
+            with self._lock:
+                self.rejected += 1
+            LOGGER.error('submit: command queue full, dropping %s for %s', command.get('cmd'), address)
+            return False
+        with self._lock:
+            self.depth += 1
+            if address in self._nodes:
+                # A worker has this node, it will pick this up in order
+                self._nodes[address].append((fun, command, time.time()))
+                return True
+            self._nodes[address] = deque([(fun, command, time.time())])
+        self._ready.put(address)
+        return True
+
+    def _record(self, name, seconds):
+        self.metrics.observe('command_' + name, seconds)
+        t = self.timing[name]
+        t['count'] += 1
+        t['total'] += seconds
+        if seconds > t['max']:
+            t['max'] = seconds
+
+    def _worker(self):
+        while True:
+            address = self._ready.get()
+            if address is None:
+                break
+            with self._lock:
+                fun, command, queued = self._nodes[address].popleft()
+            start = time.time()
+            try:
+                if self.context is not None:
+                    with self.context():
+                        self.metrics.call(fun, command)
+                else:
+                    self.metrics.call(fun, command)
+            except Exception as err:
+                LOGGER.error('_worker: failed %s.runCmd(%s) %s', address, command.get('cmd'), err, exc_info=True)
+            end = time.time()
+            with self._lock:
+                self._record('wait', start - queued)
+                self._record('run', end - start)
+                self.depth -= 1
+                if not self.depth:
+                    self._idle.notify_all()
+                if self._nodes[address]:
+                    # Go to the back of the line so other nodes get a turn
+                    self._ready.put(address)
+                else:
+                    del self._nodes[address]
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            stats = {'depth': self.depth, 'rejected': self.rejected}
+            for name, t in self.timing.items():
+                stats[name + '_avg_ms'] = round(t['total'] / t['count'] * 1000, 1) if t['count'] else 0
+                stats[name + '_max_ms'] = round(t['max'] * 1000, 1)
+        return stats
+
+    def stop(self, timeout=10):
+        end = time.time() + timeout
+        with self._idle:
+            # A node's next command is queued behind the stop markers once
+            # its current one is done, so wait for all of them first.
+            while self.depth and time.time() < end:
+                self._idle.wait(end - time.time())
+            left = self.depth
+        if left:
+            LOGGER.warning('stop: %d commands still queued or running after %ss, dropping them', left, timeout)
+        for thread in self._threads:
+            self._ready.put(None)
+        for thread in self._threads:
+            thread.join(max(0, end - time.time()))
+        return left
@@ -0,0 +1,184 @@
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+
+LOGGER = polyinterface.LOGGER
+
+class DriverStore(object):
+    """
+    Driver values for all compact nodes, kept in one list per driver and
+    field, indexed by a row number per node, instead of a list of dictionaries
+    on every node.
+
+    Class Methods:
+    add(address, drivers): Row for the node address, created if needed, with
+        the drivers list of dictionaries loaded into it.
+    get(row, driver, field): Field is value, uom, reported or reported_uom.
+    set(row, driver, field, value)
+    names(row): Tuple of driver names for the row, in order.
+    remove(address): Free the node's row for reuse.
+    """
+    FIELDS = ('value', 'uom', 'reported', 'reported_uom')
+
+    def __init__(self):
+        self.rows = {}
+        self._free = []
+        self._size = 0
+        # driver -> field -> list indexed by row
+        self._columns = {}
+        # row -> tuple of driver names, the tuples are shared between rows
+        self._names = []
+        self._shapes = {}
+
+    def add(self, address, drivers):
+        row = self.rows.get(address)
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+            else:
+                row = self._size
+                self._size += 1
+                self._names.append(())
+                for column in self._columns.values():
+                    for field in self.FIELDS:
+                        column[field].append(None)
+            self.rows[address] = row
+        names = tuple(d['driver'] for d in drivers)
+        self._names[row] = self._shapes.setdefault(names, names)
+        for d in drivers:
+            column = self._columns.get(d['driver'])
+            if column is None:
+                column = self._columns[d['driver']] = dict(
+                    (field, [None] * self._size) for field in self.FIELDS)
+            column['value'][row] = column['reported'][row] = d['value']
+            column['uom'][row] = column['reported_uom'][row] = d['uom']
+        return row
+
+    def get(self, row, driver, field='value'):
+        return self._columns[driver][field][row]
+
+    def set(self, row, driver, field, value):
+        self._columns[driver][field][row] = value
+
+    def names(self, row):
+        return self._names[row]
+
+    def remove(self, address):
+        row = self.rows.pop(address, None)
+        if row is not None:
+            self._names[row] = ()
+            self._free.append(row)
+
+class DriverView(dict):
+    """
+    One driver of a compact node as the usual {'driver', 'value', 'uom'}
+    dictionary. Changing value or uom writes through to the DriverStore.
+    """
+    __slots__ = ('_store', '_row', '_reported')
+
+    def __init__(self, store, row, driver, reported=False):
+        value, uom = ('reported', 'reported_uom') if reported else ('value', 'uom')
+        dict.__init__(self, driver=driver, value=store.get(row, driver, value), uom=store.get(row, driver, uom))
+        self._store = store
+        self._row = row
+        self._reported = reported
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        if key in ('value', 'uom'):
+            field = key if not self._reported else ('reported' if key == 'value' else 'reported_uom')
+            self._store.set(self._row, self['driver'], field, value)
+
+    def __copy__(self):
+        # Copies are plain dictionaries, copying the slots would copy the
+        # whole DriverStore along with the view.
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return dict(self)
+
+class CompactNode(object):
+    """
+    Mix in before a node class to keep the node small when there are thousands
+    of them: attributes live in __slots__ and driver values in the controller's
+    DriverStore. node.drivers still returns the list of driver dictionaries and
+    setDriver/getDriver/reportDriver/reportDrivers work as before.
+
+        class CompactTemplateNode(CompactNode, TemplateNode):
+            __slots__ = ()
+
+    getDriver returns the last value reported to Polyglot from the store
+    instead of searching Polyglot's config.
+    """
+    __slots__ = ('controller', 'parent', 'primary', 'address', 'name', 'polyConfig',
+                 'isPrimary', 'config', 'timeAdded', 'enabled', 'added', '_row')
+
+    def _defaults(self):
+        for cls in type(self).__mro__:
+            drivers = cls.__dict__.get('drivers')
+            if isinstance(drivers, list):
+                return drivers
+        return []
+
+    def _views(self, reported):
+        store = self.controller.driver_store
+        return [DriverView(store, self._row, name, reported) for name in store.names(self._row)]
+
+    @property
+    def drivers(self):
+        if getattr(self, '_row', None) is None:
+            # Not in the store yet, this is Node.__init__ copying the defaults
+            return self._defaults()
+        return self._views(False)
+
+    @drivers.setter
+    def drivers(self, drivers):
+        self._row = self.controller.driver_store.add(self.address, drivers)
+
+    @property
+    def _drivers(self):
+        return self._views(True)
+
+    @_drivers.setter
+    def _drivers(self, drivers):
+        self.updateDrivers(drivers)
+
+    def updateDrivers(self, drivers):
+        store = self.controller.driver_store
+        for d in drivers:
+            if d['driver'] in store.names(self._row):
+                store.set(self._row, d['driver'], 'reported', d['value'])
+                store.set(self._row, d['driver'], 'reported_uom', d['uom'])
+
+    def setDriver(self, driver, value, report=True, force=False, uom=None):
+        store = self.controller.driver_store
+        if driver not in store.names(self._row):
+            return
+        store.set(self._row, driver, 'value', value)
+        if uom is not None:
+            store.set(self._row, driver, 'uom', uom)
+        if report:
+            self.reportDriver({'driver': driver, 'value': value,
+                'uom': store.get(self._row, driver, 'uom')}, report, force)
+
+    def getDriver(self, dv):
+        store = self.controller.driver_store
+        if dv not in store.names(self._row):
+            return None
+        return store.get(self._row, dv, 'reported')
+
+    def reportDriver(self, driver, report, force):
+        store = self.controller.driver_store
+        name = driver['driver']
+        if name not in store.names(self._row):
+            return
+        reported = store.get(self._row, name, 'reported')
+        uom_changed = store.get(self._row, name, 'reported_uom') != driver['uom']
+        if force or uom_changed or str(reported) != str(driver['value']):
+            if not (force or uom_changed or
+                    self.controller.driver_filter.allow(self, name, reported, driver['value'])):
+                return
+            store.set(self._row, name, 'reported', driver['value'])
+            store.set(self._row, name, 'reported_uom', driver['uom'])
+            self.controller.batcher.status(self.address, name, driver['value'], driver['uom'])
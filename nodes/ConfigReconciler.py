@@ -0,0 +1,87 @@
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+import hashlib
+import threading
+
+LOGGER = polyinterface.LOGGER
+
+class ConfigReconciler(object):
+    """
+    Keeps the notices and custom params the node server wants and sends
+    Polyglot only what differs from what it already has, instead of removing
+    every notice and adding them all back.
+
+    Call notice() and param() for everything wanted, then commit(). Notices
+    that were not asked for since the last commit are removed, params not
+    mentioned are left alone. All param changes go in one customparams
+    message, each notice added or removed is one message.
+
+    Class Methods:
+    notice(text, key=None): Want this notice shown. Without a key the notice
+        gets one made from the text, so it can be compared next time.
+    param(key, value, replace=True): Want this custom param. With replace
+        False it is only set when the param is missing.
+    commit(): Send the differences, returns the number of each change sent.
+    confirm(config): onConfig callback, Polyglot's config is what it has now.
+    """
+    def __init__(self, poly):
+        self.poly = poly
+        self._lock = threading.Lock()
+        self._want_notices = {}
+        self._want_params = {}
+        # What Polyglot has, counting what was sent since its last config
+        self._notices = None
+        self._params = None
+
+    def notice(self, text, key=None):
+        if key is None:
+            key = 'n' + hashlib.md5(text.encode('utf-8')).hexdigest()[:8]
+        with self._lock:
+            self._want_notices[key] = text
+
+    def param(self, key, value, replace=True):
+        with self._lock:
+            self._want_params[key] = (value, replace)
+
+    def confirm(self, config):
+        with self._lock:
+            self._notices = self._notice_dict(config.get('notices'))
+            self._params = dict(config.get('customParams') or {})
+
+    def _notice_dict(self, notices):
+        if isinstance(notices, list):
+            # Old Polyglot keeps a list, notices are removed by index
+            return dict(enumerate(notices))
+        return dict(notices or {})
+
+    def commit(self):
+        with self._lock:
+            want_notices, self._want_notices = self._want_notices, {}
+            want_params, self._want_params = self._want_params, {}
+            if self._notices is None:
+                self._notices = self._notice_dict(self.poly.config.get('notices'))
+            if self._params is None:
+                self._params = dict(self.poly.config.get('customParams') or {})
+            remove = [key for key in self._notices if key not in want_notices]
+            add = [(key, text) for key, text in want_notices.items() if self._notices.get(key) != text]
+            params = {}
+            for key, (value, replace) in want_params.items():
+                if key not in self._params or (replace and self._params[key] != value):
+                    params[key] = value
+            for key in remove:
+                del self._notices[key]
+            self._notices.update(add)
+            if params:
+                self._params.update(params)
+                new_params = dict(self._params)
+        for key in remove:
+            self.poly.removeNotice({'key': str(key)})
+        for key, text in add:
+            self.poly.addNotice({'key': key, 'value': text})
+        if params:
+            self.poly.saveCustomParams(new_params)
+        stats = {'notices_removed': len(remove), 'notices_added': len(add), 'params_changed': len(params)}
+        LOGGER.debug('ConfigReconciler: %s', stats)
+        return stats
@@ -0,0 +1,119 @@
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+import threading
+import time
+
+LOGGER = polyinterface.LOGGER
+
+class ConfigWatcher(object):
+    """
+    Makes onConfig usable for live changes. Polyglot sends its config several
+    times for a single change, so the configs are collected until none has
+    come for debounce seconds (or max_wait has passed), then the last one is
+    compared with the one before and each handler is called once with only
+    the changes to its section.
+
+    The first config is only remembered, start() handles it.
+
+        watcher.subscribe('customParams', handler)
+        poly.onConfig(watcher.config)
+
+    handler(changes, value) gets a dictionary with added, removed and changed
+    (key: (old, new)) entries and the new value of the section.
+
+    Class Methods:
+    subscribe(section, handler): Call handler when section of the config changes,
+        e.g. customParams, typedCustomData, customData or notices.
+    config(config): onConfig callback.
+    flush(): Handle the waiting config now.
+    stop(): Cancel the timer, a waiting config is dropped.
+    stats(): Dictionary of configs received and applied.
+    """
+    def __init__(self, debounce=1.0, max_wait=5.0):
+        """
+        :param debounce: Seconds without a new config before handling the last one
+        :param max_wait: Most seconds to hold a config while more keep coming
+        """
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self.handlers = {}
+        self.received = 0
+        self.applied = 0
+        self._lock = threading.Lock()
+        self._last = None
+        self._pending = None
+        self._first = None
+        self._timer = None
+
+    def subscribe(self, section, handler):
+        self.handlers.setdefault(section, []).append(handler)
+
+    def config(self, config):
+        with self._lock:
+            self.received += 1
+            if self._last is None:
+                self._last = self._sections(config)
+                return
+            self._pending = config
+            if self._first is None:
+                self._first = time.time()
+            if self._timer is not None:
+                self._timer.cancel()
+            delay = max(0, min(self.debounce, self._first + self.max_wait - time.time()))
+            self._timer = threading.Timer(delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _sections(self, config):
+        sections = {}
+        for section in self.handlers:
+            value = config.get(section)
+            if isinstance(value, list):
+                value = dict(enumerate(value))
+            sections[section] = dict(value or {})
+        return sections
+
+    def _diff(self, old, new):
+        changes = {'added': {}, 'removed': {}, 'changed': {}}
+        for key, value in new.items():
+            if key not in old:
+                changes['added'][key] = value
+            elif old[key] != value:
+                changes['changed'][key] = (old[key], value)
+        for key, value in old.items():
+            if key not in new:
+                changes['removed'][key] = value
+        return changes
+
+    def flush(self):
+        with self._lock:
+            config, self._pending = self._pending, None
+            self._first = None
+            self._timer = None
+            if config is None:
+                return
+            old, new = self._last, self._sections(config)
+            self._last = new
+            self.applied += 1
+        for section, handlers in self.handlers.items():
+            changes = self._diff(old.get(section, {}), new[section])
+            if not any(changes.values()):
+                continue
+            LOGGER.debug('ConfigWatcher: %s %s', section, changes)
+            for handler in handlers:
+                try:
+                    handler(changes, new[section])
+                except Exception as err:
+                    LOGGER.error('ConfigWatcher: %s handler failed: %s', section, err, exc_info=True)
+
+    def stop(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._pending = None
+
+    def stats(self):
+        return {'received': self.received, 'applied': self.applied}
@@ -0,0 +1,115 @@
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+LOGGER = polyinterface.LOGGER
+
+class Discovery(object):
+    """
+    Finds devices and brings the controller's nodes in line with them, sending
+    Polyglot only what changed. The devices found are kept in an inventory file,
+    and while it is newer than max_age a restart rebuilds the nodes from it
+    instead of probing every device again.
+
+    The controller supplies the device specific parts:
+    controller.discover_targets(): List of things to probe, e.g. IP addresses.
+    controller.probe_device(target): Dictionary with address, name and node_def_id
+        for the device, or None if there is nothing there.
+    controller.node_class(node_def_id): The node Class for a node_def_id.
+
+    Class Methods:
+    run(force=False): Probe (or use the inventory when it is fresh and force is
+        False), then add, update and remove nodes. Returns counts of each.
+    apply(devices, complete=True): Bring the nodes in line with devices, only
+        removing nodes when complete.
+    """
+    def __init__(self, controller, inventory, max_age=86400, workers=8):
+        """
+        :param controller: The controller the nodes are added to
+        :param inventory: Storage for the device inventory
+        :param max_age: Seconds the inventory is trusted on restart
+        :param workers: Number of devices probed at the same time
+        """
+        self.controller = controller
+        self.inventory = inventory
+        self.max_age = max_age
+        self.workers = workers
+
+    def _probe(self, target):
+        try:
+            return self.controller.probe_device(target)
+        except Exception as err:
+            LOGGER.error('discover: probe of %s failed: %s', target, err, exc_info=True)
+            return False
+
+    def probe(self):
+        """
+        Probe all targets in parallel. Returns the found devices by address and
+        whether every probe completed, since a failed probe doesn't mean the
+        device is gone.
+        """
+        targets = self.controller.discover_targets()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='Discover') as executor:
+            results = list(executor.map(self._probe, targets))
+        devices = dict((d['address'], d) for d in results if d)
+        return devices, False not in results
+
+    def run(self, force=False):
+        start = time.time()
+        saved = self.inventory.load()
+        age = start - saved.get('time', 0)
+        if not force and saved.get('devices') and age < self.max_age:
+            LOGGER.info('discover: using inventory from %d seconds ago', age)
+            devices, complete = saved['devices'], True
+        else:
+            devices, complete = self.probe()
+            if not complete:
+                # Keep what we knew about devices that failed to answer
+                for address, device in saved.get('devices', {}).items():
+                    devices.setdefault(address, device)
+            self.inventory.save({'time': time.time(), 'devices': devices})
+        counts = self.apply(devices, complete)
+        LOGGER.info('discover: %s in %.2fs', counts, time.time() - start)
+        return counts
+
+    def apply(self, devices, complete=True):
+        """
+        Add, restore and remove nodes to match devices. When complete is False
+        some probes failed, so nodes Polyglot has are never removed, even
+        without a saved inventory to say what they were.
+        """
+        controller = self.controller
+        add, restore, remove = [], [], []
+        for address, device in devices.items():
+            existing = controller._nodes.get(address)
+            node = controller.nodes.get(address)
+            if (existing is not None and
+                    existing.get('name', device['name']) == device['name'] and
+                    existing.get('node_def_id', device['node_def_id']) == device['node_def_id']):
+                # Polyglot already has it as is, just needs to be in memory.
+                if node is None:
+                    restore.append(self.build(device))
+            elif (node is None or node.name != device['name'] or
+                    node.id != device['node_def_id']):
+                add.append(self.build(device))
+        for address in list(controller._nodes):
+            if address != controller.address and address not in devices:
+                remove.append(address)
+        if remove and not complete:
+            LOGGER.warning('discover: not all devices answered, keeping %d nodes that were not found: %s',
+                           len(remove), remove)
+            remove = []
+        for node in restore:
+            controller.restoreNode(node)
+        controller.addNodes(add)
+        for address in remove:
+            controller.delNode(address)
+            controller._nodes.pop(address, None)
+        return {'found': len(devices), 'added': len(add), 'restored': len(restore), 'removed': len(remove)}
+
+    def build(self, device):
+        cls = self.controller.node_class(device['node_def_id'])
+        return cls(self.controller, self.controller.address, device['address'], device['name'])
@@ -0,0 +1,91 @@
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+import threading
+from collections import OrderedDict
+
+LOGGER = polyinterface.LOGGER
+
+class DriverBatcher(object):
+    """
+    Collects driver status updates for a short window and sends them together.
+    If the same node/driver is set more than once in the window only the last
+    value is sent, the earlier ones are dropped.
+
+    Class Methods:
+    status(address, driver, value, uom): Queue a status update, the window timer
+        starts with the first update after a flush.
+    flush(): Send everything queued now.
+    stop(): Cancel the timer and flush what is left.
+    stats(): Dictionary of submitted, sent and saved message counts.
+    """
+    def __init__(self, send, window=0.5, urgent=None):
+        """
+        :param send: Function called with each status message dictionary, normally poly.send
+        :param window: Seconds to collect updates before they are sent. 0 sends immediately.
+        :param urgent: Function returning True when an update should be sent
+            immediately on the calling thread, e.g. while running a command.
+        """
+        self.send = send
+        self.window = window
+        self.urgent = urgent
+        self.submitted = 0
+        self.sent = 0
+        self._pending = OrderedDict()
+        self._timer = None
+        self._lock = threading.Lock()
+
+    def status(self, address, driver, value, uom):
+        message = {
+            'status': {
+                'address': address,
+                'driver': driver,
+                'value': str(value),
+                'uom': uom
+            }
+        }
+        if self.urgent is not None and self.urgent():
+            with self._lock:
+                self.submitted += 1
+                self.sent += 1
+                # An older value still waiting must not follow this one
+                self._pending.pop((address, driver), None)
+            self.send(message)
+            return
+        with self._lock:
+            self.submitted += 1
+            self._pending[(address, driver)] = message
+            if self.window > 0:
+                if self._timer is None:
+                    self._timer = threading.Timer(self.window, self.flush)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+        self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending = self._pending
+            self._pending = OrderedDict()
+            self._timer = None
+        for message in pending.values():
+            self.send(message)
+        with self._lock:
+            self.sent += len(pending)
+        if pending:
+            LOGGER.debug('flush: sent %d status updates, %d saved so far', len(pending), self.saved)
+
+    @property
+    def saved(self):
+        return self.submitted - self.sent - len(self._pending)
+
+    def stats(self):
+        with self._lock:
+            return {'submitted': self.submitted, 'sent': self.sent, 'saved': self.saved}
+
+    def stop(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+        self.flush()
@@ -0,0 +1,105 @@
+import threading
+import time
+from .Metrics import Metrics
+
+class DriverFilter(object):
+    """
+    Keeps noisy driver values from being reported on every small change.
+    Settings go on the driver entries in the node class drivers list:
+
+        drivers = [
+            {'driver': 'ST', 'value': 0, 'uom': 2},
+            {'driver': 'CLITEMP', 'value': 0, 'uom': 17, 'deadband': 0.5, 'hysteresis': 0.5, 'min_interval': 60},
+        ]
+
+    deadband: A change smaller than this from the last value reported is not reported.
+    hysteresis: Added to the deadband when the value turns back the other way
+        from the last change reported, so a value wobbling around a point
+        isn't reported every time it turns.
+    min_interval: Seconds after a report before the driver is reported again.
+
+    A change of uom and forced reports are never filtered. The last value is
+    still kept on the node, so QUERY sends it.
+
+    Class Methods:
+    allow(node, driver, reported, value): True if the change from the reported
+        value to value should be reported now.
+    settings(node_class): Dictionary of driver name to its filter settings.
+    strip(drivers): Copy of a drivers list with only driver, value and uom.
+    forget(address): Drop what is kept for a deleted node.
+    stats(): Filtered count for each driver.
+    """
+    KEYS = ('deadband', 'hysteresis', 'min_interval')
+    _settings = {}
+
+    def __init__(self, metrics=None, enabled=True):
+        """
+        :param metrics: Metrics to count driver_filtered in
+        :param enabled: False to report every change
+        """
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        # address -> driver -> [time reported, direction of the change reported]
+        self._state = {}
+        self.filtered = {}
+
+    @classmethod
+    def settings(cls, node_class):
+        settings = cls._settings.get(node_class)
+        if settings is None:
+            settings = {}
+            for klass in node_class.__mro__:
+                drivers = klass.__dict__.get('drivers')
+                if isinstance(drivers, list):
+                    for d in drivers:
+                        found = dict((key, d[key]) for key in cls.KEYS if key in d)
+                        if found:
+                            settings[d['driver']] = found
+                    break
+            cls._settings[node_class] = settings
+        return settings
+
+    @classmethod
+    def strip(cls, drivers):
+        return [{'driver': d['driver'], 'value': d['value'], 'uom': d['uom']} for d in drivers]
+
+    def allow(self, node, driver, reported, value):
+        if not self.enabled:
+            return True
+        settings = self.settings(type(node)).get(driver)
+        if settings is None:
+            return True
+        now = time.time()
+        with self._lock:
+            states = self._state.setdefault(node.address, {})
+            state = states.get(driver)
+            try:
+                change = float(value) - float(reported)
+            except (TypeError, ValueError):
+                change = None
+            allowed = True
+            if change is not None:
+                band = settings.get('deadband', 0)
+                if state is not None and change * state[1] < 0:
+                    band += settings.get('hysteresis', 0)
+                if abs(change) < band:
+                    allowed = False
+            if state is not None and now - state[0] < settings.get('min_interval', 0):
+                allowed = False
+            if not allowed:
+                self.filtered[driver] = self.filtered.get(driver, 0) + 1
+            else:
+                direction = (change > 0) - (change < 0) if change else (state[1] if state is not None else 0)
+                states[driver] = [now, direction]
+        if not allowed:
+            self.metrics.incr('driver_filtered')
+        return allowed
+
+    def forget(self, address):
+        with self._lock:
+            self._state.pop(address, None)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.filtered)
@@ -0,0 +1,31 @@
+import urllib3
+from urllib3.util import Retry, Timeout
+
+class HttpPool(urllib3.PoolManager):
+    """
+    The one urllib3.PoolManager shared by the controller and all of its nodes.
+    Connections are kept alive and reused between requests, and requests wait
+    for a free connection rather than opening more than maxsize per host.
+    Nodes use it as self.controller.http.request(...)
+    """
+    def __init__(self, num_pools=10, maxsize=4, retries=3, backoff_factor=0.5,
+                 connect_timeout=5.0, read_timeout=10.0):
+        """
+        :param num_pools: Number of hosts to keep connection pools for
+        :param maxsize: Maximum open connections per host
+        :param retries: Number of retries on connection errors and 5xx responses
+        :param backoff_factor: Retry sleep is backoff_factor * 2^(retry - 1) seconds
+        :param connect_timeout: Seconds to wait for a connection
+        :param read_timeout: Seconds to wait for a response
+        """
+        super(HttpPool, self).__init__(
+            num_pools=num_pools,
+            maxsize=maxsize,
+            block=True,
+            retries=Retry(
+                total=retries,
+                backoff_factor=backoff_factor,
+                status_forcelist=(500, 502, 503, 504),
+            ),
+            timeout=Timeout(connect=connect_timeout, read=read_timeout),
+        )
@@ -0,0 +1,117 @@
+import copy
+import logging
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+class RateLimit(logging.Filter):
+    """
+    Limits DEBUG records to rate per second for each module, with bursts of up
+    to burst records. Past the limit only one in every sample records is kept.
+    Other levels are never limited.
+    """
+    def __init__(self, rate=20, burst=100, sample=50):
+        super(RateLimit, self).__init__()
+        self.rate = rate
+        self.burst = burst
+        self.sample = sample
+        self._lock = threading.Lock()
+        # module -> [tokens, last refill time, records over the limit]
+        self._buckets = {}
+        self.dropped = {}
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate is None:
+            return True
+        now = time.time()
+        with self._lock:
+            bucket = self._buckets.get(record.module)
+            if bucket is None:
+                bucket = self._buckets[record.module] = [self.burst, now, 0]
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return True
+            bucket[2] += 1
+            if bucket[2] % self.sample == 0:
+                return True
+            self.dropped[record.module] = self.dropped.get(record.module, 0) + 1
+            return False
+
+class _Handler(QueueHandler):
+    def __init__(self, queue, target):
+        super(_Handler, self).__init__(queue)
+        self.target = target
+
+    def prepare(self, record):
+        # Runs after the level check and rate limit. The arguments are often
+        # live objects another thread may change before the writer gets to
+        # them, so the message is made now, the log format and the file
+        # write are left to the writer thread.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def setFormatter(self, fmt):
+        # LOG_HANDLER.set_log_format sets the format on this handler
+        self.target.setFormatter(fmt)
+
+class LogPipeline(object):
+    """
+    Moves writing the polyinterface log file off the poll and MQTT threads.
+    Log calls put the record on a queue, with its message made from the
+    arguments, and a background thread formats and writes it. DEBUG records
+    are rate limited per module, see RateLimit, before the message is made.
+
+    LOG_HANDLER.handler is replaced with the queue handler, so
+    LOG_HANDLER.set_basic_config and set_log_format keep working, as does
+    changing the level with LOGGER.setLevel.
+
+    Class Methods:
+    start(): Switch the loggers over to the queue.
+    stop(): Write out what is queued and put the file handler back.
+    stats(): Queue depth and dropped DEBUG records per module.
+    """
+    def __init__(self, log_handler, rate=20, burst=100, sample=50):
+        """
+        :param log_handler: polyinterface LOG_HANDLER
+        :param rate: DEBUG records per second allowed for each module, None for no limit
+        :param burst: DEBUG records a module can log at once before the rate applies
+        :param sample: Past the limit, keep one in this many DEBUG records
+        """
+        self.log_handler = log_handler
+        self.target = log_handler.handler
+        self.queue = queue.Queue()
+        self.limit = RateLimit(rate, burst, sample)
+        self.handler = _Handler(self.queue, self.target)
+        self.handler.addFilter(self.limit)
+        self.listener = QueueListener(self.queue, self.target)
+        self.running = False
+
+    def _swap(self, old, new):
+        loggers = [self.log_handler.logger, logging.root]
+        if hasattr(self.log_handler, 'warnlog'):
+            loggers.append(self.log_handler.warnlog)
+        for logger in loggers:
+            if old in logger.handlers:
+                logger.removeHandler(old)
+                logger.addHandler(new)
+        self.log_handler.handler = new
+
+    def start(self):
+        if not self.running:
+            self.listener.start()
+            self._swap(self.target, self.handler)
+            self.running = True
+
+    def stop(self):
+        if self.running:
+            self._swap(self.handler, self.target)
+            self.listener.stop()
+            self.running = False
+
+    def stats(self):
+        return {'queued': self.queue.qsize(), 'dropped': dict(self.limit.dropped)}
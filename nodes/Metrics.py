@@ -0,0 +1,198 @@
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+LOGGER = polyinterface.LOGGER
+
+class Histogram(object):
+    """
+    Latency histogram with fixed millisecond buckets, cheap enough to update
+    on every poll and command.
+    """
+    BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, 60000)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def observe(self, ms):
+        i = 0
+        while i < len(self.BUCKETS) and ms > self.BUCKETS[i]:
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += ms
+        self.last = ms
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, p):
+        # Upper bound of the bucket the percentile falls in
+        want = self.count * p / 100.0
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if n and seen >= want:
+                return self.BUCKETS[i] if i < len(self.BUCKETS) else self.max
+        return 0
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total / self.count, 2) if self.count else 0,
+            'last_ms': round(self.last, 2),
+            'max_ms': round(self.max, 2),
+            'p50_ms': self.percentile(50),
+            'p90_ms': self.percentile(90),
+            'p99_ms': self.percentile(99),
+        }
+
+class Metrics(object):
+    """
+    Timings and counters for the poll, command and publish paths.
+
+    Class Methods:
+    observe(name, seconds): Add a timing to the name histogram.
+    timer(name): Context manager that times the block into the name histogram.
+    incr(name, n=1): Add to a counter.
+    call(fun, *args): Run fun(*args), under cProfile if profiling is on and
+        no other call is being profiled.
+    profile(seconds): Profile calls run through call() for this many
+        seconds, then write the stats to logs/ and log the top functions.
+        Only one profiler can be active at a time, so calls made while
+        another is profiled run without it.
+    summary(): Dictionary of all histogram summaries and counters.
+    serve(port): Serve summary() as JSON on http://127.0.0.1:port/
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.started = time.time()
+        self._profile = None
+        # Held by the call being profiled
+        self._profiling = threading.Lock()
+        self._server = None
+
+    def observe(self, name, seconds):
+        with self._lock:
+            hist = self.histograms.get(name)
+            if hist is None:
+                hist = self.histograms[name] = Histogram()
+            hist.observe(seconds * 1000.0)
+
+    @contextmanager
+    def timer(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - start)
+
+    def incr(self, name, n=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def get(self, name, default=0):
+        with self._lock:
+            return self.counters.get(name, default)
+
+    def last_ms(self, name):
+        with self._lock:
+            hist = self.histograms.get(name)
+            return hist.last if hist is not None else 0
+
+    def summary(self):
+        with self._lock:
+            return {
+                'uptime': round(time.time() - self.started),
+                'timings': dict((name, h.summary()) for name, h in self.histograms.items()),
+                'counters': dict(self.counters),
+            }
+
+    def serve(self, port):
+        # Imported here, most node servers never serve or profile and these
+        # are slow to import.
+        from http.server import BaseHTTPRequestHandler, HTTPServer
+        metrics = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = json.dumps(metrics.summary(), sort_keys=True).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            def log_message(self, *args):
+                pass
+        self._server = HTTPServer(('127.0.0.1', port), Handler)
+        thread = threading.Thread(target=self._server.serve_forever, name='Metrics')
+        thread.daemon = True
+        thread.start()
+        LOGGER.info('Metrics: serving on http://127.0.0.1:%d/', port)
+
+    def call(self, fun, *args):
+        if self._profile is None or not self._profiling.acquire(False):
+            return fun(*args)
+        try:
+            import cProfile
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Another profiling tool, e.g. a debugger, is active
+                return fun(*args)
+            try:
+                return fun(*args)
+            finally:
+                profiler.disable()
+                with self._lock:
+                    if self._profile is not None:
+                        self._profile.append(profiler)
+        finally:
+            self._profiling.release()
+
+    def profile(self, seconds):
+        with self._lock:
+            if self._profile is not None:
+                LOGGER.warning('Metrics: profiling already running')
+                return
+            self._profile = []
+        LOGGER.warning('Metrics: profiling polls and commands for %d seconds', seconds)
+        timer = threading.Timer(seconds, self._profile_done)
+        timer.daemon = True
+        timer.start()
+
+    def _profile_done(self):
+        with self._lock:
+            profilers, self._profile = self._profile, None
+        if not profilers:
+            LOGGER.warning('Metrics: nothing ran while profiling')
+            return
+        import io
+        import pstats
+        stats = pstats.Stats(profilers[0])
+        for profiler in profilers[1:]:
+            stats.add(profiler)
+        path = os.path.join('logs', 'profile-%d.pstats' % time.time())
+        try:
+            stats.dump_stats(path)
+        except (IOError, OSError) as err:
+            LOGGER.error('Metrics: failed to write %s: %s', path, err)
+        out = io.StringIO()
+        stats.stream = out
+        stats.sort_stats('cumulative').print_stats(15)
+        LOGGER.warning('Metrics: profile of %d calls saved to %s\n%s', len(profilers), path, out.getvalue())
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
@@ -0,0 +1,189 @@
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from .Metrics import Metrics
+
+LOGGER = polyinterface.LOGGER
+
+class Outbound(object):
+    """
+    Sends messages to Polyglot in priority order, no faster than rate messages
+    per second with bursts of up to burst, so a poll burst or a full QUERY
+    doesn't hold up the reply to a user's command.
+
+    Priorities, highest first:
+    COMMAND: Driver changes made while running a command from ISY.
+    HEARTBEAT: Never waits for the rate limit, so it is never starved.
+    POLL: Driver changes from polls, the default.
+    BULK: Full driver reports for QUERY.
+
+    POLL and BULK status messages waiting to be sent are replaced by a newer
+    value for the same node driver, or dropped when a higher priority status
+    for it is put, and the oldest are dropped past maxsize.
+    COMMAND and HEARTBEAT messages are never dropped.
+
+    Class Methods:
+    put(message, priority=None): Queue a message, without a priority the one
+        set for this thread by priority() is used, or POLL.
+    priority(level): Context manager, messages put on this thread inside it
+        default to level.
+    current(): The priority put() uses on this thread.
+    flush(): Send everything queued now, ignoring the rate.
+    stop(): Flush and stop the sender thread.
+    stats(): Queued, sent, deferred and dropped counts for each priority.
+    """
+    COMMAND, HEARTBEAT, POLL, BULK = range(4)
+    NAMES = ('command', 'heartbeat', 'poll', 'bulk')
+
+    def __init__(self, send, rate=20, burst=40, maxsize=10000, metrics=None):
+        """
+        :param send: Function called with each message, normally poly.send
+        :param rate: Messages per second, None for no limit
+        :param burst: Messages that can be sent at once after a quiet period
+        :param maxsize: Most POLL or BULK messages kept waiting
+        :param metrics: Metrics to record the outbound_* counters and waits in
+        """
+        self.send = send
+        self.rate = rate
+        self.burst = burst
+        self.maxsize = maxsize
+        self.metrics = metrics if metrics is not None else Metrics()
+        self._local = threading.local()
+        self._cond = threading.Condition()
+        self._send_lock = threading.Lock()
+        # COMMAND and HEARTBEAT in order, POLL and BULK by status key
+        self._queues = (deque(), deque(), OrderedDict(), OrderedDict())
+        self._tokens = float(burst)
+        self._refilled = time.time()
+        self._seq = 0
+        self.sent = [0] * 4
+        self.deferred = [0] * 4
+        self.dropped = [0] * 4
+        self.running = True
+        self._thread = threading.Thread(target=self._sender, name='Outbound')
+        self._thread.daemon = True
+        self._thread.start()
+
+    @contextmanager
+    def priority(self, level):
+        previous = getattr(self._local, 'level', None)
+        self._local.level = level
+        try:
+            yield
+        finally:
+            self._local.level = previous
+
+    def current(self):
+        level = getattr(self._local, 'level', None)
+        return self.POLL if level is None else level
+
+    def put(self, message, priority=None):
+        if priority is None:
+            priority = self.current()
+        queue = self._queues[priority]
+        with self._cond:
+            if 'status' in message:
+                # An older value still waiting at a lower priority is sent
+                # later, it must not follow this one and overwrite it in ISY.
+                key = (message['status']['address'], message['status']['driver'])
+                for lower in range(max(priority + 1, self.POLL), len(self._queues)):
+                    if self._queues[lower].pop(key, None) is not None:
+                        self.dropped[lower] += 1
+            if priority < self.POLL:
+                queue.append((message, time.time()))
+            else:
+                if 'status' not in message:
+                    self._seq += 1
+                    key = self._seq
+                if key in queue:
+                    # Only the newest value matters, it keeps the older one's
+                    # place so a busy driver can't keep moving to the back.
+                    queue[key] = (message, queue[key][1])
+                    self.dropped[priority] += 1
+                else:
+                    if len(queue) >= self.maxsize:
+                        queue.popitem(last=False)
+                        self.dropped[priority] += 1
+                    queue[key] = (message, time.time())
+            self._cond.notify()
+
+    def _refill(self, now):
+        if self.rate is not None:
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+    def _next(self):
+        # Highest priority message, None if there is nothing queued
+        for priority, queue in enumerate(self._queues):
+            if queue:
+                if priority < self.POLL:
+                    return priority, queue.popleft()
+                return priority, queue.popitem(last=False)[1]
+        return None
+
+    def _sender(self):
+        deferring = False
+        while True:
+            with self._cond:
+                while self.running and not any(self._queues):
+                    self._cond.wait()
+                if not self.running:
+                    return
+                now = time.time()
+                self._refill(now)
+                if not self._queues[self.HEARTBEAT] and self.rate is not None and self._tokens < 1:
+                    # Wait for a token, a heartbeat or a higher priority
+                    # message arriving in the meantime is still picked first.
+                    if not deferring:
+                        head = next(p for p, q in enumerate(self._queues) if q)
+                        self.deferred[head] += 1
+                        deferring = True
+                    self._cond.wait((1 - self._tokens) / self.rate)
+                    continue
+                deferring = False
+                priority, (message, queued) = self._next()
+                if priority != self.HEARTBEAT and self.rate is not None:
+                    self._tokens -= 1
+            self._send(priority, message, queued)
+
+    def _send(self, priority, message, queued):
+        with self._send_lock:
+            try:
+                self.send(message)
+            except Exception as err:
+                LOGGER.error('Outbound: send failed: %s', err, exc_info=True)
+            self.sent[priority] += 1
+        self.metrics.observe('outbound_wait_' + self.NAMES[priority], time.time() - queued)
+
+    def flush(self):
+        while True:
+            with self._cond:
+                item = self._next()
+            if item is None:
+                return
+            priority, (message, queued) = item
+            self._send(priority, message, queued)
+
+    def stop(self):
+        with self._cond:
+            self.running = False
+            self._cond.notify()
+        self._thread.join(5)
+        self.flush()
+
+    def stats(self):
+        with self._cond:
+            stats = {}
+            for priority, name in enumerate(self.NAMES):
+                stats[name] = {
+                    'queued': len(self._queues[priority]),
+                    'sent': self.sent[priority],
+                    'deferred': self.deferred[priority],
+                    'dropped': self.dropped[priority],
+                }
+            return stats
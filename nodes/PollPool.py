@@ -0,0 +1,155 @@
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from .Metrics import Metrics
+
+LOGGER = polyinterface.LOGGER
+
+class PollPool(object):
+    """
+    Runs node polls on a bounded pool of worker threads so one slow device
+    doesn't hold up the rest of the cycle.
+
+    Class Methods:
+    run(nodes, method='shortPoll', deadline=None): Calls node.method() for each node
+        on the pool and waits until every poll is done or has passed its deadline.
+        A node whose previous poll is still running is skipped, and so are polls
+        still waiting for a worker when the cycle has run for deadline seconds. Returns a dict
+        of counts for the cycle.
+    submit(node, method='shortPoll'): Start one node poll without waiting on it.
+        Returns the future, or None if the node's last poll is still running.
+    busy(address): True if a poll for this node address is still running.
+    backlog(): Number of polls waiting for a worker.
+    queued(): Addresses of the polls waiting for a worker.
+    running(): Dictionary of address to seconds for the polls running now.
+    cancel(address): Cancel the node's poll if it hasn't started, returns True
+        if it was cancelled.
+    shutdown(): Stops the worker threads, does not wait on hung polls.
+    """
+    def __init__(self, max_workers=8, deadline=30, metrics=None, polled=None):
+        """
+        :param max_workers: Maximum number of polls running at the same time
+        :param deadline: Default seconds a single node poll may run before it
+            is reported as timed out and the cycle stops waiting on it.
+        :param metrics: Metrics to record node_poll and poll_cycle times and
+            poll_overruns in
+        :param polled: Function called with each node after a poll that didn't fail
+        """
+        self.max_workers = max_workers
+        self.deadline = deadline
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.polled = polled
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='Poll')
+        self._lock = threading.Lock()
+        # address -> future of the poll that is queued or running for it
+        self._running = {}
+        # address -> time the poll actually started on a worker
+        self._started = {}
+
+    def busy(self, address):
+        with self._lock:
+            return address in self._running
+
+    def backlog(self):
+        with self._lock:
+            return len(self._running) - len(self._started)
+
+    def queued(self):
+        with self._lock:
+            return [a for a in self._running if a not in self._started]
+
+    def running(self):
+        now = time.time()
+        with self._lock:
+            return dict((a, now - start) for a, start in self._started.items())
+
+    def cancel(self, address):
+        with self._lock:
+            future = self._running.get(address)
+            # A poll that started can't be stopped
+            if future is None or address in self._started or not future.cancel():
+                return False
+            del self._running[address]
+        self.metrics.incr('poll_cancelled')
+        return True
+
+    def _poll(self, node, method):
+        with self._lock:
+            self._started[node.address] = start = time.time()
+        try:
+            self.metrics.call(getattr(node, method))
+            if self.polled is not None:
+                self.polled(node)
+        finally:
+            with self._lock:
+                self._running.pop(node.address, None)
+                self._started.pop(node.address, None)
+            self.metrics.observe('node_poll', time.time() - start)
+
+    def submit(self, node, method='shortPoll'):
+        with self._lock:
+            if node.address in self._running:
+                self.metrics.incr('poll_overruns')
+                return None
+            future = self._executor.submit(self._poll, node, method)
+            self._running[node.address] = future
+            return future
+
+    def run(self, nodes, method='shortPoll', deadline=None):
+        if deadline is None:
+            deadline = self.deadline
+        stats = {'started': 0, 'skipped': 0, 'failed': 0, 'timed_out': 0, 'cancelled': 0}
+        cycle_start = time.time()
+        pending = {}
+        for node in nodes:
+            future = self.submit(node, method)
+            if future is None:
+                LOGGER.warning('%s: %s still running, skipping this cycle', node.address, method)
+                stats['skipped'] += 1
+                continue
+            pending[future] = node.address
+            stats['started'] += 1
+        while pending:
+            # Wake up at least once a second to check the per node deadlines.
+            done, _ = wait(list(pending), timeout=1, return_when=FIRST_COMPLETED)
+            for future in done:
+                address = pending.pop(future)
+                if future.cancelled():
+                    stats['cancelled'] += 1
+                    continue
+                err = future.exception()
+                if err is not None:
+                    stats['failed'] += 1
+                    LOGGER.error('%s: %s failed: %s', address, method, err, exc_info=err)
+            now = time.time()
+            with self._lock:
+                late = [f for f, a in pending.items()
+                        if a in self._started and now - self._started[a] > deadline]
+            for future in late:
+                address = pending.pop(future)
+                stats['timed_out'] += 1
+                self.metrics.incr('poll_overruns')
+                # Threads can't be killed, the poll keeps running in the background
+                # and this node is skipped until it returns.
+                LOGGER.warning('%s: %s exceeded %ss deadline, no longer waiting on it', address, method, deadline)
+            if now - cycle_start > deadline:
+                # Polls still waiting for a worker, held up by hung ones, don't
+                # get to hold up the cycle too.
+                with self._lock:
+                    queued = [f for f, a in pending.items() if a not in self._started]
+                for future in queued:
+                    address = pending.pop(future)
+                    self.cancel(address)
+                    stats['skipped'] += 1
+                    LOGGER.warning('%s: %s still waiting for a worker after %ss, skipping this cycle', address, method, deadline)
+        stats['elapsed'] = time.time() - cycle_start
+        self.metrics.observe('poll_cycle', stats['elapsed'])
+        LOGGER.debug('%s cycle: %s', method, stats)
+        return stats
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,141 @@
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+import random
+import threading
+import time
+
+LOGGER = polyinterface.LOGGER
+
+class PollScheduler(object):
+    """
+    Polls each node on its own interval using a timing wheel, instead of every
+    node at once on shortPoll. Nodes start at a random point in their interval
+    so polls are spread out, and the interval adapts to the node: it is halved
+    when a poll changed a driver value and grows by half when nothing changed,
+    staying between the node class poll_min_interval, or default_interval
+    when it has none, and poll_max_interval.
+    The delay to the next poll is the interval times stretch(node), which
+    the PollWatchdog raises while it sheds load.
+
+    Class Methods:
+    add(node): Start polling a node. Does nothing if it is already scheduled.
+    remove(address): Stop polling a node.
+    interval(address): Current poll interval in seconds for the node.
+    start(): Start the scheduler thread.
+    stop(): Stop it.
+    """
+    def __init__(self, pool, tick=1.0, slots=512, default_interval=120, stretch=None):
+        """
+        :param pool: PollPool the polls run on
+        :param tick: Seconds per wheel slot, the scheduling resolution
+        :param slots: Number of slots in the wheel. Intervals longer than
+            tick * slots go round the wheel more than once.
+        :param default_interval: Interval for node classes that don't set
+            poll_min_interval/poll_max_interval
+        :param stretch: Function of a node returning the factor its next
+            poll delay is multiplied by, default 1
+        """
+        self.pool = pool
+        self.tick = tick
+        self.default_interval = default_interval
+        self.stretch = stretch if stretch is not None else (lambda node: 1)
+        self._wheel = [[] for _ in range(slots)]
+        self._pos = 0
+        self._lock = threading.Lock()
+        # address -> [node, interval seconds]
+        self._nodes = {}
+        self._running = False
+        self._thread = None
+
+    def _limits(self, node):
+        low = getattr(node, 'poll_min_interval', None) or self.default_interval
+        high = getattr(node, 'poll_max_interval', None) or max(low, self.default_interval)
+        return low, high
+
+    def add(self, node):
+        with self._lock:
+            if node.address in self._nodes:
+                self._nodes[node.address][0] = node
+                return
+            low, high = self._limits(node)
+            interval = min(max(self.default_interval, low), high)
+            self._nodes[node.address] = [node, interval]
+            # Spread first polls over the whole interval
+            self._schedule(node.address, random.uniform(0, interval))
+
+    def remove(self, address):
+        with self._lock:
+            self._nodes.pop(address, None)
+
+    def interval(self, address):
+        with self._lock:
+            return self._nodes[address][1] if address in self._nodes else None
+
+    def _schedule(self, address, delay):
+        # Must hold self._lock
+        ticks = max(1, int(round(delay / self.tick)))
+        slots = len(self._wheel)
+        self._wheel[(self._pos + ticks) % slots].append([address, (ticks - 1) // slots])
+
+    def _due(self):
+        with self._lock:
+            self._pos = (self._pos + 1) % len(self._wheel)
+            slot = self._wheel[self._pos]
+            due = [entry[0] for entry in slot if entry[1] == 0]
+            waiting = [entry for entry in slot if entry[1] > 0]
+            for entry in waiting:
+                entry[1] -= 1
+            self._wheel[self._pos] = waiting
+            return [self._nodes[address][0] for address in due if address in self._nodes]
+
+    def _poll(self, node):
+        before = [d['value'] for d in node.drivers]
+        future = self.pool.submit(node)
+        if future is None:
+            LOGGER.debug('%s: last poll still running, skipping', node.address)
+            self._done(node, before, None)
+        else:
+            future.add_done_callback(lambda f: self._done(node, before, f))
+
+    def _done(self, node, before, future):
+        if future is not None and future.cancelled():
+            # Shed by the watchdog, wait for the next poll like a skipped one
+            future = None
+        if future is not None and future.exception() is not None:
+            err = future.exception()
+            LOGGER.error('%s: shortPoll failed: %s', node.address, err, exc_info=err)
+        changed = future is not None and [d['value'] for d in node.drivers] != before
+        with self._lock:
+            entry = self._nodes.get(node.address)
+            if entry is None:
+                return
+            low, high = self._limits(node)
+            if changed:
+                entry[1] = max(low, entry[1] / 2.0)
+            elif future is not None:
+                entry[1] = min(high, entry[1] * 1.5)
+            self._schedule(node.address, entry[1] * self.stretch(node))
+
+    def _run(self):
+        next_tick = time.monotonic()
+        while self._running:
+            next_tick += self.tick
+            time.sleep(max(0, next_tick - time.monotonic()))
+            for node in self._due():
+                try:
+                    self._poll(node)
+                except Exception as err:
+                    LOGGER.error('%s: failed to start poll: %s', node.address, err, exc_info=True)
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='PollScheduler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
@@ -0,0 +1,135 @@
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+import threading
+import time
+from .Metrics import Metrics
+
+LOGGER = polyinterface.LOGGER
+
+class PollWatchdog(object):
+    """
+    Watches the poll loops for overruns and sheds load until they keep up
+    again. check() is called once per shortPoll and measures the load:
+
+        poll cycles: time the cycle took / time since the last cycle started
+        poll scheduler: polls waiting on the pool / pool workers
+
+    When the load reaches overrun the shed level goes up by one, up to
+    max_level. At level L nodes with a poll_priority below L are polled
+    2 ** (L - poll_priority) times less often: skipped on poll cycles, or
+    their interval stretched by the scheduler. Their polls still waiting on
+    the pool are cancelled. After recover_checks checks in a row
+    below recover the level goes down by one.
+
+    Node polls running longer than hung seconds are logged as stuck. Their
+    threads can't be stopped, the node isn't polled again until the poll
+    returns.
+
+    Class Methods:
+    check(elapsed=None): Measure the load and change the shed level, elapsed
+        is the time the poll cycle took. Returns the level.
+    stretch(node): Factor the node's poll interval is multiplied by.
+    due(node): False if the node is skipped on this poll cycle.
+    stats(): Level, load, stuck polls and level changes.
+    """
+    def __init__(self, pool, nodes, max_level=3, overrun=0.9, recover=0.5, recover_checks=3, hung=120, metrics=None):
+        """
+        :param pool: PollPool the polls run on
+        :param nodes: Dictionary of address to node, the controller's nodes
+        :param max_level: Highest shed level, nodes with a poll_priority of
+            at least max_level are never shed
+        :param overrun: Load the level goes up at
+        :param recover: Load the level goes down below
+        :param recover_checks: Checks in a row under recover before the level goes down
+        :param hung: Seconds before a running node poll is reported as stuck
+        :param metrics: Metrics to count poll_shed, poll_recovered and poll_stuck in
+        """
+        self.pool = pool
+        self.nodes = nodes
+        self.max_level = max_level
+        self.overrun = overrun
+        self.recover = recover
+        self.recover_checks = recover_checks
+        self.hung = hung
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.level = 0
+        self.load = 0.0
+        self._lock = threading.Lock()
+        self._cycle = 0
+        self._last_start = None
+        self._healthy = 0
+        # address -> seconds its poll had been running when found stuck
+        self._stuck = {}
+
+    def check(self, elapsed=None):
+        now = time.time()
+        with self._lock:
+            self._cycle += 1
+            load = self.pool.backlog() / float(self.pool.max_workers)
+            if elapsed is not None:
+                start = now - elapsed
+                if self._last_start is not None and start > self._last_start:
+                    load = max(load, elapsed / (start - self._last_start))
+                self._last_start = start
+            self.load = load
+            if load >= self.overrun:
+                self._healthy = 0
+                if self.level < self.max_level:
+                    self.level += 1
+                    self.metrics.incr('poll_shed')
+                    LOGGER.warning('PollWatchdog: polls not keeping up, load %.2f, shedding level %d',
+                                   load, self.level)
+            elif load < self.recover and self.level:
+                self._healthy += 1
+                if self._healthy >= self.recover_checks:
+                    self._healthy = 0
+                    self.level -= 1
+                    self.metrics.incr('poll_recovered')
+                    LOGGER.warning('PollWatchdog: load %.2f, back to shedding level %d', load, self.level)
+            else:
+                self._healthy = 0
+            level = self.level
+        if level:
+            self._cancel_shed()
+        self._check_hung()
+        return level
+
+    def _cancel_shed(self):
+        # Shed polls still waiting on the pool give their place to the rest
+        for address in self.pool.queued():
+            node = self.nodes.get(address)
+            if node is not None and self.stretch(node) > 1 and self.pool.cancel(address):
+                LOGGER.debug('PollWatchdog: %s poll cancelled', address)
+
+    def _check_hung(self):
+        running = self.pool.running()
+        for address, seconds in running.items():
+            if seconds > self.hung and address not in self._stuck:
+                self._stuck[address] = seconds
+                self.metrics.incr('poll_stuck')
+                LOGGER.error('PollWatchdog: %s poll stuck for %.0fs, not polling it until it returns',
+                             address, seconds)
+        for address in list(self._stuck):
+            if address not in running:
+                del self._stuck[address]
+                LOGGER.warning('PollWatchdog: %s stuck poll returned', address)
+
+    def stretch(self, node):
+        shed = self.level - getattr(node, 'poll_priority', 0)
+        return 2 ** shed if shed > 0 else 1
+
+    def due(self, node):
+        factor = self.stretch(node)
+        # Spread the skipped nodes over the cycles instead of polling them all together
+        return factor == 1 or (self._cycle + hash(node.address)) % factor == 0
+
+    def stats(self):
+        return {
+            'level': self.level,
+            'load': round(self.load, 2),
+            'stuck': len(self._stuck),
+            'shed': self.metrics.get('poll_shed'),
+            'recovered': self.metrics.get('poll_recovered'),
+        }
@@ -0,0 +1,137 @@
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+import hashlib
+import os
+
+LOGGER = polyinterface.LOGGER
+
+class ProfileBuilder(object):
+    """
+    Writes profile/nodedef/nodedefs.xml and profile/nls/en_us.txt from the
+    node classes, so they can't get out of step with the drivers and commands
+    in the code. The node def has a st for every entry in the class drivers
+    list and accepts every command in the class commands dictionary. Editors
+    and names come from the class profile dictionary:
+
+        profile = {
+            'nls': 'tmplnode',
+            'name': 'Template Node',
+            'drivers': {'ST': {'editor': 'bool', 'name': 'Node Status'}},
+            'commands': {'PING': {'name': 'Ping'}},
+            'sends': ['DON', 'DOF'],
+            'strings': [('CDM-10', 'Debug')],
+        }
+
+    commands entries can also have an editor and init for a parameter,
+    strings are extra nls lines. profile/editor/editors.xml is still written
+    by hand.
+
+    Instead of a profile_version to bump, hash() is a hash of everything in
+    the profile directory, so the profile is only installed when it changed.
+
+    Class Methods:
+    nodedefs(): The nodedefs.xml text.
+    nls(): The en_us.txt text.
+    write(): Write the files that changed, returns the profile hash.
+    hash(): Hash of all the files in the profile directory.
+    """
+    HEADER = 'Generated from the node classes by nodes/ProfileBuilder.py, change the classes and restart'
+
+    def __init__(self, node_classes, path='profile'):
+        """
+        :param node_classes: Controller and node classes, the first class for each id is used
+        :param path: Profile directory
+        """
+        self.path = path
+        self.classes = []
+        seen = set()
+        for cls in node_classes:
+            if cls.id not in seen:
+                seen.add(cls.id)
+                self.classes.append(cls)
+
+    def nodedefs(self):
+        lines = ['<nodeDefs>', '    <!-- %s -->' % self.HEADER]
+        for cls in self.classes:
+            profile = cls.profile
+            lines.append('    <nodeDef id="%s" nls="%s">' % (cls.id, profile['nls']))
+            lines.append('        <editors />')
+            lines.append('        <sts>')
+            for d in cls.drivers:
+                editor = profile.get('drivers', {}).get(d['driver'], {}).get('editor', 'bool')
+                lines.append('            <st id="%s" editor="%s" />' % (d['driver'], editor))
+            lines.append('        </sts>')
+            lines.append('        <cmds>')
+            lines.append(self._cmds('sends', [(cmd, {}) for cmd in profile.get('sends', [])]))
+            lines.append(self._cmds('accepts', [(cmd, profile.get('commands', {}).get(cmd, {})) for cmd in cls.commands]))
+            lines.append('        </cmds>')
+            lines.append('    </nodeDef>')
+        lines.append('</nodeDefs>')
+        return '\n'.join(lines) + '\n'
+
+    def _cmds(self, tag, cmds):
+        if not cmds:
+            return '            <%s />' % tag
+        lines = ['            <%s>' % tag]
+        for cmd, info in cmds:
+            if 'editor' in info:
+                init = ' init="%s"' % info['init'] if 'init' in info else ''
+                lines.append('                <cmd id="%s">' % cmd)
+                lines.append('                    <p id="" editor="%s"%s />' % (info['editor'], init))
+                lines.append('                </cmd>')
+            else:
+                lines.append('                <cmd id="%s" />' % cmd)
+        lines.append('            </%s>' % tag)
+        return '\n'.join(lines)
+
+    def nls(self):
+        lines = ['# %s' % self.HEADER]
+        for cls in self.classes:
+            profile = cls.profile
+            nls = profile['nls']
+            lines.append('')
+            lines.append('# %s' % cls.id)
+            lines.append('ND-%s-NAME = %s' % (cls.id, profile['name']))
+            for cmd in cls.commands:
+                name = profile.get('commands', {}).get(cmd, {}).get('name')
+                if name:
+                    lines.append('CMD-%s-%s-NAME = %s' % (nls, cmd, name))
+            for d in cls.drivers:
+                name = profile.get('drivers', {}).get(d['driver'], {}).get('name')
+                if name:
+                    lines.append('ST-%s-%s-NAME = %s' % (nls, d['driver'], name))
+            for key, value in profile.get('strings', []):
+                lines.append('%s = %s' % (key, value))
+        return '\n'.join(lines) + '\n'
+
+    def _write(self, name, text):
+        path = os.path.join(self.path, name)
+        try:
+            with open(path) as f:
+                if f.read() == text:
+                    return False
+        except (IOError, OSError):
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as f:
+            f.write(text)
+        LOGGER.info('ProfileBuilder: wrote %s', path)
+        return True
+
+    def write(self):
+        self._write(os.path.join('nodedef', 'nodedefs.xml'), self.nodedefs())
+        self._write(os.path.join('nls', 'en_us.txt'), self.nls())
+        return self.hash()
+
+    def hash(self):
+        digest = hashlib.sha256()
+        for root, dirs, files in os.walk(self.path):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                digest.update(os.path.relpath(path, self.path).encode('utf-8'))
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+        return digest.hexdigest()
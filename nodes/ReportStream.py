@@ -0,0 +1,77 @@
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+import threading
+import time
+from collections import OrderedDict
+
+LOGGER = polyinterface.LOGGER
+
+class ReportStream(object):
+    """
+    Sends a full driver report to Polyglot at a steady rate in the background
+    instead of all at once, so a QUERY on a large system doesn't flood the ISY.
+    Only the node drivers are queued, each value is read when it is sent, so a
+    poll or command while the report is going isn't overwritten by an older
+    value. Starting a new report while one is still going only adds the
+    drivers that aren't queued yet.
+
+    Class Methods:
+    report(keys): Queue a list of (address, driver) to be sent at rate per second.
+    pending(): Number of drivers still to be sent.
+    stop(): Stop sending, anything not sent yet is dropped.
+    """
+    def __init__(self, send, value, rate=20):
+        """
+        :param send: Function called with each status message dictionary
+        :param value: Function called with address and driver, returns the
+            current (value, uom), or None if the node or driver is gone
+        :param rate: Messages per second
+        """
+        self.send = send
+        self.value = value
+        self.rate = rate
+        self._pending = OrderedDict()
+        self._cond = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='ReportStream')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def report(self, keys):
+        with self._cond:
+            for key in keys:
+                self._pending[key] = True
+            self._cond.notify()
+        LOGGER.info('report: streaming %d driver values at %s/s', len(keys), self.rate)
+
+    def pending(self):
+        with self._cond:
+            return len(self._pending)
+
+    def _run(self):
+        interval = 1.0 / self.rate
+        while True:
+            with self._cond:
+                while self._running and not self._pending:
+                    self._cond.wait()
+                if not self._running:
+                    return
+                (address, driver), _ = self._pending.popitem(last=False)
+            start = time.time()
+            try:
+                current = self.value(address, driver)
+                if current is None:
+                    continue
+                value, uom = current
+                self.send({'status': {'address': address, 'driver': driver, 'value': str(value), 'uom': uom}})
+            except Exception as err:
+                LOGGER.error('ReportStream: send failed: %s', err, exc_info=True)
+            time.sleep(max(0, interval - (time.time() - start)))
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._pending.clear()
+            self._cond.notify()
@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict
+from .Metrics import Metrics
+
+class ResponseCache(object):
+    """
+    Device responses kept for ttl seconds, so a QUERY or command right after
+    a poll doesn't ask the device again. Holds up to maxsize responses and
+    drops the least recently used. While a request for a key is running,
+    other callers for the same key wait for it instead of sending their own.
+
+        r = controller.cache.get(url, lambda: controller.http.request('GET', url))
+
+    Errors are passed to every waiting caller and not cached.
+
+    Class Methods:
+    get(key, fetch, ttl=None): Cached response for key, or fetch() called once
+        for everyone asking at the same time.
+    invalidate(key): Forget key, e.g. after a command changed the device.
+    clear()
+    stats(): Hits, misses, coalesced requests, hit ratio and size.
+    """
+    def __init__(self, ttl=5, maxsize=1000, metrics=None):
+        """
+        :param ttl: Seconds a response is used for
+        :param maxsize: Most responses kept
+        :param metrics: Metrics to count cache_hit, cache_miss and cache_coalesced in
+        """
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.metrics = metrics if metrics is not None else Metrics()
+        self._lock = threading.Lock()
+        # key -> (expires, response), least recently used first
+        self._entries = OrderedDict()
+        # key -> _Flight for requests running now
+        self._flights = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def get(self, key, fetch, ttl=None):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                flight = None
+            else:
+                flight = self._flights.get(key)
+                owner = flight is None
+                if owner:
+                    self.misses += 1
+                    flight = self._flights[key] = _Flight()
+                else:
+                    self.coalesced += 1
+        if flight is None:
+            self.metrics.incr('cache_hit')
+            return entry[1]
+        if not owner:
+            self.metrics.incr('cache_coalesced')
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        self.metrics.incr('cache_miss')
+        try:
+            flight.result = fetch()
+        except Exception as err:
+            flight.error = err
+            raise
+        else:
+            with self._lock:
+                self._entries[key] = (time.time() + (self.ttl if ttl is None else ttl), flight.result)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+            return flight.result
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses + self.coalesced
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'hit_ratio': round(float(self.hits + self.coalesced) / total, 3) if total else 0,
+                'size': len(self._entries),
+            }
+
+class _Flight(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
@@ -0,0 +1,43 @@
+import threading
+
+class ShadowCache(object):
+    """
+    The last value sent to Polyglot for every node/driver, and whether Polyglot
+    has confirmed it by sending it back in its config. A delta QUERY only has
+    to send the drivers where needs() is True.
+
+    Class Methods:
+    sent(status): Record a status message payload that was just sent.
+    confirm(config): onConfig callback, marks values Polyglot has stored as confirmed.
+    needs(address, driver, value, uom): True if the value is new, different
+        or not yet confirmed.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (address, driver) -> [value, uom, confirmed]
+        self._values = {}
+
+    def sent(self, status):
+        with self._lock:
+            self._values[(status['address'], status['driver'])] = [str(status['value']), status['uom'], False]
+
+    def confirm(self, config):
+        with self._lock:
+            for node in config.get('nodes', []):
+                for driver in node.get('drivers', []):
+                    key = (node['address'], driver['driver'])
+                    shadow = self._values.get(key)
+                    if shadow is None:
+                        # Never sent by us, but this is what Polyglot has
+                        self._values[key] = [str(driver['value']), driver.get('uom'), True]
+                    elif shadow[0] == str(driver['value']):
+                        shadow[2] = True
+
+    def needs(self, address, driver, value, uom):
+        with self._lock:
+            shadow = self._values.get((address, driver))
+        return shadow is None or not shadow[2] or shadow[0] != str(value) or shadow[1] != uom
+
+    def unconfirmed(self):
+        with self._lock:
+            return sum(1 for shadow in self._values.values() if not shadow[2])
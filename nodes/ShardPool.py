@@ -0,0 +1,362 @@
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+import logging
+import multiprocessing
+import threading
+import time
+from logging.handlers import QueueHandler
+from nodes.DriverFilter import DriverFilter
+from nodes.CompactNode import DriverStore
+from nodes.HttpPool import HttpPool
+from nodes.ResponseCache import ResponseCache
+from nodes.TemplateController import load_class
+
+LOGGER = polyinterface.LOGGER
+
+class ShardPool(object):
+    """
+    Runs node polls and commands in worker processes, so CPU heavy polls can
+    use more than one core. The controller keeps the Polyglot connection and
+    its own copy of every node. Each node is also created in one worker, from
+    controller.compact_node_classes, and that copy polls and runs commands.
+    Driver changes come back from the worker in batches and are set on the
+    controller's copy, which reports them as usual.
+
+    Messages on the pipes are small tuples:
+        ('add', node_def_id, primary, address, name, [(driver, value, uom), ...])
+        ('remove', address)
+        ('poll', seq, method, [skip address, ...])
+            ->  ('status', [(address, driver, value, uom), ...], False)
+                ('done', seq, {'polled': n, 'failed': n})
+        ('cmd', address, command)  ->  ('status', [...], True)
+        ('stop',)
+
+    A worker that exits is started again and gets its nodes back, with the
+    driver values the controller has. The restart waits restart_delay
+    seconds, doubling with each crash in a row up to a minute. After
+    max_restarts crashes in a row without finishing a poll the worker is
+    given up on, and its nodes go to the other workers, or are polled in
+    the controller's process if there are none left.
+
+    Class Methods:
+    start(): Start the worker processes.
+    add(node): Give the node to the worker with the fewest nodes, or poll it in
+        the controller's process when all workers were given up on.
+    remove(address)
+    owns(address): True if the node runs in a worker.
+    command(address, command): Run the command in the node's worker.
+    poll(method='shortPoll', skip=()): Call method on every node in the workers,
+        except the skip addresses, returns when all are done or the deadline
+        passed.
+    stop(): Stop the workers.
+    stats(): Nodes per worker, restarts and workers given up on.
+    """
+    def __init__(self, controller, processes=2, deadline=30, start_method='spawn',
+                 restart_delay=1, max_restarts=5):
+        """
+        :param controller: The controller, nodes are created from its
+            compact_node_classes, http_pool and response_cache settings.
+        :param processes: Number of worker processes
+        :param deadline: Seconds poll() waits for the workers
+        :param start_method: multiprocessing start method, spawn starts the
+            workers clean instead of forking the running controller.
+        :param restart_delay: Seconds before restarting a worker after its
+            first crash, doubled for each crash in a row
+        :param max_restarts: Crashes in a row before a worker is given up on
+        """
+        self.controller = controller
+        self.deadline = deadline
+        self.restart_delay = restart_delay
+        self.max_restarts = max_restarts
+        self.restarts = 0
+        self.running = False
+        self._stopped = threading.Event()
+        self._ctx = multiprocessing.get_context(start_method)
+        self._logs = self._ctx.Queue()
+        self._shards = [_Shard(i) for i in range(processes)]
+        self._where = {}
+        self._cond = threading.Condition()
+        self._seq = 0
+        # seq -> [shard indexes still polling, stats]
+        self._polls = {}
+
+    def start(self):
+        self.running = True
+        thread = threading.Thread(target=self._read_logs, name='ShardLogs')
+        thread.daemon = True
+        thread.start()
+        for shard in self._shards:
+            self._spawn(shard)
+
+    def _spawn(self, shard):
+        conn, child = self._ctx.Pipe()
+        shard.process = self._ctx.Process(
+            target=_worker, name='Shard%d' % shard.index,
+            args=(child, self._logs, LOGGER.getEffectiveLevel(),
+                  self.controller.compact_node_classes, self.controller.http_pool,
+                  self.controller.response_cache))
+        shard.process.daemon = True
+        shard.process.start()
+        child.close()
+        shard.conn = conn
+        shard.up = True
+        reader = threading.Thread(target=self._read, args=(shard, conn), name='Shard%dReader' % shard.index)
+        reader.daemon = True
+        reader.start()
+        for address in list(shard.addresses):
+            self._send(shard, self._add_message(address))
+        LOGGER.info('ShardPool: worker %d started with %d nodes, pid %s',
+                    shard.index, len(shard.addresses), shard.process.pid)
+
+    def _add_message(self, address):
+        node = self.controller.nodes[address]
+        drivers = [(d['driver'], d['value'], d['uom']) for d in node.drivers]
+        return ('add', node.id, node.primary, address, node.name, drivers)
+
+    def _send(self, shard, message):
+        with shard.lock:
+            try:
+                shard.conn.send(message)
+            except (OSError, ValueError) as err:
+                # The reader sees the worker is gone and restarts it
+                LOGGER.error('ShardPool: send to worker %d failed: %s', shard.index, err)
+
+    def add(self, node):
+        if node.address in self._where:
+            return
+        healthy = [s for s in self._shards if not s.failed]
+        if not healthy:
+            self.controller._poll_local(node)
+            return
+        shard = min(healthy, key=lambda s: len(s.addresses))
+        shard.addresses.add(node.address)
+        self._where[node.address] = shard
+        if self.running:
+            self._send(shard, self._add_message(node.address))
+
+    def remove(self, address):
+        shard = self._where.pop(address, None)
+        if shard is not None:
+            shard.addresses.discard(address)
+            if self.running:
+                self._send(shard, ('remove', address))
+
+    def owns(self, address):
+        return address in self._where
+
+    def command(self, address, command):
+        self._send(self._where[address], ('cmd', address, command))
+
+    def poll(self, method='shortPoll', skip=()):
+        start = time.time()
+        with self._cond:
+            self._seq += 1
+            seq = self._seq
+            shards = [s for s in self._shards if s.addresses and s.up]
+            # Nodes of workers waiting to restart
+            down = sum(len(s.addresses) for s in self._shards if not s.up)
+            self._polls[seq] = [set(s.index for s in shards), {'polled': 0, 'failed': down}]
+        for shard in shards:
+            self._send(shard, ('poll', seq, method, [a for a in skip if a in shard.addresses]))
+        end = start + self.deadline
+        with self._cond:
+            while self._polls[seq][0] and time.time() < end:
+                self._cond.wait(end - time.time())
+            waiting, stats = self._polls.pop(seq)
+        stats['late'] = len(waiting)
+        if waiting:
+            LOGGER.warning('ShardPool: workers %s did not finish %s in %ss', sorted(waiting), method, self.deadline)
+        self.controller.metrics.observe('poll_cycle', time.time() - start)
+        return stats
+
+    def _read(self, shard, conn):
+        while True:
+            try:
+                message = conn.recv()
+            except (EOFError, OSError):
+                break
+            if message[0] == 'status':
+                if message[2]:
+                    # Changes made by a command go out ahead of poll updates
+                    with self.controller.outbound.priority(self.controller.outbound.COMMAND):
+                        self._status(message[1])
+                else:
+                    self._status(message[1])
+            elif message[0] == 'done':
+                shard.crashes = 0
+                with self._cond:
+                    poll = self._polls.get(message[1])
+                    if poll is not None:
+                        poll[0].discard(shard.index)
+                        for key, value in message[2].items():
+                            poll[1][key] += value
+                        self._cond.notify_all()
+        if self.running and shard.conn is conn:
+            self._crashed(shard)
+
+    def _status(self, updates):
+        for address, driver, value, uom in updates:
+            node = self.controller.nodes.get(address)
+            if node is not None:
+                node.setDriver(driver, value, uom=uom)
+
+    def _crashed(self, shard):
+        shard.up = False
+        shard.crashes += 1
+        shard.process.join(1)
+        with self._cond:
+            for waiting, stats in self._polls.values():
+                if shard.index in waiting:
+                    waiting.discard(shard.index)
+                    stats['failed'] += len(shard.addresses)
+            self._cond.notify_all()
+        if shard.crashes > self.max_restarts:
+            self._give_up(shard)
+            return
+        delay = min(60, self.restart_delay * 2 ** (shard.crashes - 1))
+        LOGGER.error('ShardPool: worker %d exited with %s, restarting it with its %d nodes in %ss',
+                     shard.index, shard.process.exitcode, len(shard.addresses), delay)
+        if self._stopped.wait(delay):
+            return
+        self.restarts += 1
+        self.controller.metrics.incr('shard_restarts')
+        self._spawn(shard)
+
+    def _give_up(self, shard):
+        shard.failed = True
+        addresses = list(shard.addresses)
+        shard.addresses.clear()
+        for address in addresses:
+            self._where.pop(address, None)
+        others = [s for s in self._shards if not s.failed]
+        LOGGER.error('ShardPool: worker %d crashed %d times in a row, giving up on it, its %d nodes move to %s',
+                     shard.index, shard.crashes, len(addresses),
+                     'the other workers' if others else 'the controller process')
+        self.controller.metrics.incr('shard_failed')
+        for address in addresses:
+            node = self.controller.nodes.get(address)
+            if node is None:
+                continue
+            self.add(node)
+
+    def _read_logs(self):
+        while True:
+            record = self._logs.get()
+            if record is None:
+                break
+            LOGGER.handle(record)
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self._stopped.set()
+        for shard in self._shards:
+            if shard.up:
+                self._send(shard, ('stop',))
+        for shard in self._shards:
+            shard.process.join(5)
+            if shard.process.is_alive():
+                shard.process.terminate()
+        self._logs.put(None)
+
+    def stats(self):
+        return {'nodes': [len(s.addresses) for s in self._shards], 'restarts': self.restarts,
+                'failed': [s.index for s in self._shards if s.failed]}
+
+class _Shard(object):
+    def __init__(self, index):
+        self.index = index
+        self.process = None
+        self.conn = None
+        self.addresses = set()
+        self.lock = threading.Lock()
+        # Running, not waiting to be restarted
+        self.up = False
+        # Crashes since the worker last finished a poll
+        self.crashes = 0
+        self.failed = False
+
+def _worker(conn, logs, level, node_classes, http_pool, response_cache):
+    # Log records go back to the controller's process to be written
+    for logger in (logging.root, LOGGER):
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+    LOGGER.addHandler(QueueHandler(logs))
+    LOGGER.setLevel(level)
+    _WorkerController(conn, node_classes, http_pool, response_cache).run()
+
+class _WorkerController(object):
+    """
+    Stands in for the controller for the nodes in a worker process. Driver
+    updates are collected and sent back after each message, commands run
+    right away.
+    """
+    shards = None
+
+    def __init__(self, conn, node_classes, http_pool, response_cache):
+        self.conn = conn
+        self.node_classes = node_classes
+        self.nodes = {}
+        self.driver_store = DriverStore()
+        # Every change goes back, the controller's filter decides what is reported
+        self.driver_filter = DriverFilter(enabled=False)
+        self.batcher = self
+        self.command_queue = self
+        self.http = HttpPool(**http_pool)
+        self.cache = ResponseCache(**response_cache)
+        self._updates = []
+
+    def status(self, address, driver, value, uom):
+        self._updates.append((address, driver, value, uom))
+
+    def submit(self, address, fun, command):
+        fun(command)
+
+    def run(self):
+        while True:
+            try:
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            if message[0] == 'stop':
+                break
+            try:
+                result = getattr(self, '_' + message[0])(*message[1:])
+            except Exception as err:
+                LOGGER.error('Shard: %s failed: %s', message[0], err, exc_info=True)
+                result = None
+            if self._updates:
+                updates, self._updates = self._updates, []
+                self.conn.send(('status', updates, message[0] == 'cmd'))
+            if message[0] == 'poll':
+                self.conn.send(('done', message[1], result or {'polled': 0, 'failed': len(self.nodes)}))
+        self.http.clear()
+
+    def _add(self, node_def_id, primary, address, name, drivers):
+        node = load_class(self.node_classes[node_def_id])(self, primary, address, name)
+        node.drivers = [{'driver': d, 'value': v, 'uom': u} for d, v, u in drivers]
+        self.nodes[address] = node
+
+    def _remove(self, address):
+        self.nodes.pop(address, None)
+        self.driver_store.remove(address)
+
+    def _cmd(self, address, command):
+        self.nodes[address].runCmd(command)
+
+    def _poll(self, seq, method, skip):
+        polled = failed = 0
+        skip = set(skip)
+        for node in list(self.nodes.values()):
+            if node.address in skip:
+                continue
+            try:
+                getattr(node, method)()
+                polled += 1
+            except Exception as err:
+                failed += 1
+                LOGGER.error('Shard: %s %s failed: %s', node.address, method, err, exc_info=True)
+        return {'polled': polled, 'failed': failed}
@@ -0,0 +1,56 @@
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+import hashlib
+import json
+import time
+
+LOGGER = polyinterface.LOGGER
+
+class Snapshot(object):
+    """
+    Node driver values, saved so a restart can put nodes back to their last
+    state right away, and hashes of what was last checked so a restart can
+    skip work when it hasn't changed.
+
+    Class Methods:
+    drivers(address): Dictionary of driver -> value saved for the node.
+    restore(node): Set the node's drivers to the saved values.
+    changed(key, data): True if data is different from the last time changed
+        was called with this key, remembers the new hash either way.
+    save(nodes): Write the current driver values and hashes.
+    """
+    def __init__(self, storage):
+        self.storage = storage
+        self.data = storage.load()
+        self.data.setdefault('drivers', {})
+        self.data.setdefault('hashes', {})
+        if self.data['drivers']:
+            LOGGER.info('Snapshot: loaded %d nodes saved %d seconds ago',
+                len(self.data['drivers']), time.time() - self.data.get('time', 0))
+
+    def drivers(self, address):
+        return self.data['drivers'].get(address, {})
+
+    def restore(self, node):
+        saved = self.drivers(node.address)
+        for driver in node.drivers:
+            if driver['driver'] in saved:
+                driver['value'] = saved[driver['driver']]
+        return len(saved)
+
+    def changed(self, key, data):
+        digest = hashlib.md5(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest()
+        if self.data['hashes'].get(key) == digest:
+            LOGGER.debug('Snapshot: %s unchanged', key)
+            return False
+        self.data['hashes'][key] = digest
+        return True
+
+    def save(self, nodes):
+        self.data['time'] = time.time()
+        self.data['drivers'] = dict(
+            (address, dict((d['driver'], d['value']) for d in node.drivers))
+            for address, node in list(nodes.items()))
+        self.storage.save(self.data)
@@ -0,0 +1,53 @@
+import threading
+import time
+from collections import OrderedDict
+
+class StartupTimer(object):
+    """
+    Seconds from process start to each step of getting the node server
+    ready, so the slow step can be found and time to ready kept down.
+    STARTUP starts the clock when nodes is imported, template-poly.py sets
+    STARTUP.started to the time it ran, before anything was imported. The
+    phases are marked as they finish:
+
+        import: polyinterface and the node classes imported
+        interface: Polyglot connection started
+        config: Config received, controller start() called
+        discovery: Nodes added
+        first_poll: First poll done, nodes have their current values
+
+    Class Methods:
+    mark(phase): Record the time of phase, only the first mark counts.
+        Returns True if this was the first.
+    phases(): Ordered dictionary of phase to seconds since start.
+    summary(): The phases as one line for the log.
+    """
+    def __init__(self, started=None):
+        """
+        :param started: time.time() the process started, default now
+        """
+        self.started = time.time() if started is None else started
+        self._lock = threading.Lock()
+        self._phases = OrderedDict()
+
+    def mark(self, phase):
+        now = time.time()
+        with self._lock:
+            if phase in self._phases:
+                return False
+            self._phases[phase] = round(now - self.started, 3)
+            return True
+
+    def phases(self):
+        with self._lock:
+            return OrderedDict(self._phases)
+
+    def summary(self):
+        parts = []
+        last = 0
+        for phase, seconds in self.phases().items():
+            parts.append('%s %.3fs (+%.3fs)' % (phase, seconds, seconds - last))
+            last = seconds
+        return ', '.join(parts)
+
+STARTUP = StartupTimer()
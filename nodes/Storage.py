@@ -0,0 +1,41 @@
+try:
+    import polyinterface
+except ImportError:
+    import pgc_interface as polyinterface
+import json
+import os
+
+LOGGER = polyinterface.LOGGER
+
+class Storage(object):
+    """
+    A small JSON file the node server keeps its own state in between restarts.
+    Writes go to a temp file first and are then renamed over the old one, so a
+    crash in the middle never leaves a half written file behind.
+
+    Class Methods:
+    load(): Returns the saved dictionary, or an empty one if there is no file
+        yet or it can't be read.
+    save(data): Write the dictionary.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, OSError):
+            return {}
+        except ValueError as err:
+            LOGGER.error('Storage: ignoring unreadable %s: %s', self.path, err)
+            return {}
+
+    def save(self, data):
+        tmp = self.path + '.tmp'
+        try:
+            with open(tmp, 'w') as f:
+                json.dump(data, f, separators=(',', ':'), sort_keys=True)
+            os.replace(tmp, self.path)
+        except (IOError, OSError, TypeError) as err:
+            LOGGER.error('Storage: failed to write %s: %s', self.path, err, exc_info=True)
@@ -8,13 +8,51 @@ try:
     from polyinterface import Controller,LOG_HANDLER,LOGGER
 except ImportError:
     from pgc_interface import Controller,LOGGER
+import hashlib
+import importlib
+import importlib.util
 import logging
+import sys
+import threading
+import time
 
-# My Template Node
-from nodes import TemplateNode
+from nodes.ConfigReconciler import ConfigReconciler
+from nodes.ConfigWatcher import ConfigWatcher
+from nodes.CompactNode import DriverStore
+from nodes.Outbound import Outbound
+from nodes.PollPool import PollPool
+from nodes.PollScheduler import PollScheduler
+from nodes.PollWatchdog import PollWatchdog
+from nodes.DriverBatcher import DriverBatcher
+from nodes.DriverFilter import DriverFilter
+from nodes.CommandQueue import CommandQueue
+from nodes.Discovery import Discovery
+from nodes.Storage import Storage
+from nodes.Snapshot import Snapshot
+from nodes.ShadowCache import ShadowCache
+from nodes.ReportStream import ReportStream
+from nodes.ResponseCache import ResponseCache
+from nodes.LogPipeline import LogPipeline
+from nodes.Metrics import Metrics
+from nodes.StartupTimer import STARTUP
 
 # IF you want a different log format than the current default
 LOG_HANDLER.set_log_format('%(asctime)s %(threadName)-10s %(name)-18s %(levelname)-8s %(module)s:%(funcName)s: %(message)s')
+# Write the log file from a background thread, and limit DEBUG records to
+# 20/s per module. Use LOGGER.debug('x=%s', x) instead of .format() so messages
+# are only built for records that are actually written. It is started by the
+# controller and stopped in stop(), importing nodes leaves logging alone.
+LOG_PIPELINE = LogPipeline(LOG_HANDLER, rate=20)
+
+def load_class(cls):
+    """
+    Node class for an entry in node_classes, 'module.Class' strings are
+    imported the first time they are used.
+    """
+    if isinstance(cls, str):
+        module, name = cls.rsplit('.', 1)
+        cls = getattr(importlib.import_module(module), name)
+    return cls
 
 class TemplateController(Controller):
     """
@@ -51,11 +89,80 @@ class TemplateController(Controller):
         to override the __init__ method, but if you do, you MUST call super.
         """
         super(TemplateController, self).__init__(polyglot)
+        LOG_PIPELINE.start()
         self.name = 'Template Controller'
         self.hb = 0
-        # This can be used to call your function everytime the config changes
-        # But currently it is called many times, so not using.
-        #self.poly.onConfig(self.process_config)
+        # Seconds from here until nodes report real values, see first_status()
+        self.init_time = time.time()
+        self.time_to_status = None
+        self._status_lock = threading.Lock()
+        self._discovered = False
+        # Nodes without a value from a poll or the snapshot yet
+        self._unreported = set()
+        self.snapshot = Snapshot(Storage(self.snapshot_file))
+        # Driver values of compact nodes, see compact_nodes
+        self.driver_store = DriverStore()
+        # Timings for polls, commands and publishes, see write_metrics()
+        self.metrics = Metrics()
+        if self.metrics_port:
+            self.metrics.serve(self.metrics_port)
+        self.poll_pool = PollPool(max_workers=self.poll_workers, deadline=self.poll_deadline, metrics=self.metrics,
+                                  polled=lambda node: self._reported(node.address))
+        # Sheds node polls while they don't keep up, see poll_watchdog
+        self.watchdog = PollWatchdog(self.poll_pool, self.nodes, metrics=self.metrics, **self.poll_watchdog)
+        # Polls each node on its own adaptive interval, see use_poll_scheduler
+        self.scheduler = PollScheduler(self.poll_pool, stretch=self.watchdog.stretch)
+        # Last driver values sent, confirmed when Polyglot's config has them
+        self.shadow = ShadowCache()
+        self.poly.onConfig(self.shadow.confirm)
+        # Notices and custom params, only the changes are sent, see check_params()
+        self.reconciler = ConfigReconciler(self.poly)
+        self.poly.onConfig(self.reconciler.confirm)
+        # Deadband, hysteresis and min_interval settings on node drivers
+        self.driver_filter = DriverFilter(self.metrics)
+        # Everything sent to ISY goes out here in priority order at outbound_rate
+        self.outbound = Outbound(self.publish, rate=self.outbound_rate, burst=self.outbound_burst, metrics=self.metrics)
+        # Node driver updates are collected here and sent to Polyglot together,
+        # except while running a command, then they are sent right away.
+        self.batcher = DriverBatcher(self.outbound.put, window=self.driver_batch_window,
+                                     urgent=lambda: self.outbound.current() == Outbound.COMMAND)
+        # Full driver reports are sent at query_rate messages per second
+        self.report_stream = ReportStream(lambda message: self.outbound.put(message, Outbound.BULK),
+                                          self.driver_value, rate=self.query_rate)
+        # Created on first use, see http
+        self._http = None
+        self._http_lock = threading.Lock()
+        # Device responses shared by polls, queries and commands, see TemplateNode.get_device
+        self.cache = ResponseCache(metrics=self.metrics, **self.response_cache)
+        # Commands from ISY for this and all other nodes run on here
+        self.command_queue = CommandQueue(workers=self.command_workers, maxsize=self.command_queue_size, metrics=self.metrics,
+                                          context=lambda: self.outbound.priority(Outbound.COMMAND))
+        # Node polls and commands in worker processes, see shard_workers
+        self.shards = None
+        if self.shard_workers:
+            from nodes.ShardPool import ShardPool
+            self.shards = ShardPool(self, processes=self.shard_workers, deadline=self.poll_deadline)
+        self.discovery = Discovery(self, Storage(self.inventory_file), max_age=self.inventory_max_age)
+        # Polyglot sends its config several times for every change, the watcher
+        # waits for it to settle and passes only the changes on.
+        self.config_watcher = ConfigWatcher(debounce=self.config_debounce)
+        self.config_watcher.subscribe('customParams', self.params_changed)
+        self.config_watcher.subscribe('typedCustomData', self.typed_data_changed)
+        self.poly.onConfig(self.config_watcher.config)
+
+    @property
+    def http(self):
+        """
+        One HTTP connection pool for everyone, nodes use self.controller.http.
+        It is created the first time it's used, so node servers that don't
+        make HTTP requests don't import urllib3.
+        """
+        if self._http is None:
+            with self._http_lock:
+                if self._http is None:
+                    from nodes.HttpPool import HttpPool
+                    self._http = HttpPool(**self.http_pool)
+        return self._http
 
     def start(self):
         """
@@ -66,23 +173,113 @@ class TemplateController(Controller):
         this is where you should start. No need to Super this method, the parent
         version does nothing.
         """
-        # This grabs the server.json data and checks profile_version is up to
-        # date based on the profile_version in server.json as compared to the
-        # last time run which is stored in the DB.  When testing just keep
-        # changing the profile_version to some fake string to reload on restart
-        # Only works on local currently..
-        serverdata = self.poly.get_server_data(check_profile=True)
+        # This grabs the server.json data. The profile is checked by
+        # check_profile() instead of by the profile_version in server.json,
+        # it is installed when the profile generated from the node classes
+        # changed.
+        STARTUP.mark('config')
+        serverdata = self.poly.get_server_data(check_profile=False)
+        self.check_profile()
         #serverdata['version'] = "testing"
-        LOGGER.info('Started Template NodeServer {}'.format(serverdata['version']))
+        LOGGER.info('Started Template NodeServer %s',serverdata['version'])
         # Show values on startup if desired.
         LOGGER.debug('ST=%s',self.getDriver('ST'))
         self.setDriver('ST', 1)
         self.heartbeat(0)
         self.check_params()
         self.set_debug_level(self.getDriver('GV1'))
-        self.discover()
+        if self.shards is not None:
+            self.shards.start()
+        self.scheduler.default_interval = self.poll_interval or self.short_poll_seconds()
+        # Uses the saved inventory if it's fresh, the DISCOVER command always probes.
+        self.discover(force=False)
+        STARTUP.mark('discovery')
+        if self.use_poll_scheduler:
+            self.scheduler.start()
+        # Nodes put back to their saved values during discovery have reported
+        self._discovered = True
+        self.first_status()
         self.poly.add_custom_config_docs("<b>This is some custom config docs data</b>")
 
+    def check_profile(self, force=False):
+        """
+        Generate the profile from the node classes and install it only when
+        its hash differs from the one saved in Polyglot's customData when it
+        was last installed. Returns True if it was installed.
+        While the modules the classes are in and the installed profile haven't
+        changed nothing is generated, so the node classes aren't imported,
+        unless force is True.
+        """
+        from nodes.ProfileBuilder import ProfileBuilder
+        custom_data = self.poly.config.get('customData') or {}
+        sources_changed = self.snapshot.changed('profile_sources', self._profile_sources())
+        if not (force or sources_changed) and custom_data.get('profile_hash') == ProfileBuilder([]).hash():
+            LOGGER.info('check_profile: node classes unchanged')
+            return False
+        classes = [type(self)] + [load_class(cls) for cls in self.node_classes.values()]
+        profile_hash = ProfileBuilder(classes).write()
+        if custom_data.get('profile_hash') == profile_hash:
+            LOGGER.info('check_profile: profile unchanged')
+            return False
+        LOGGER.info('check_profile: profile changed, installing it')
+        self.poly.installprofile()
+        self.saveCustomData(dict(custom_data, profile_hash=profile_hash))
+        return True
+
+    def _profile_sources(self):
+        # Hash of each module the profile is generated from, read from the
+        # files so node classes that aren't loaded yet stay that way
+        modules = set([type(self).__module__, 'nodes.ProfileBuilder'])
+        for cls in self.node_classes.values():
+            modules.add(cls.rsplit('.', 1)[0] if isinstance(cls, str) else cls.__module__)
+        sources = {}
+        for module in sorted(modules):
+            if module in sys.modules:
+                path = getattr(sys.modules[module], '__file__', None)
+            else:
+                spec = importlib.util.find_spec(module)
+                path = spec.origin if spec is not None else None
+            try:
+                with open(path, 'rb') as f:
+                    sources[module] = hashlib.md5(f.read()).hexdigest()
+            except (IOError, OSError, TypeError):
+                sources[module] = None
+        return sources
+
+    def first_status(self):
+        """
+        Records time_to_status once discovery is done and every node has
+        reported a value from its first poll or from the snapshot.
+        """
+        with self._status_lock:
+            if self.time_to_status is not None or not self._discovered or self._unreported:
+                return
+            self.time_to_status = time.time() - self.init_time
+        LOGGER.info('Nodes reporting current status %.3fs after startup', self.time_to_status)
+
+    def _wait_for_status(self, address):
+        with self._status_lock:
+            if self.time_to_status is None:
+                self._unreported.add(address)
+
+    def _reported(self, address):
+        if self.time_to_status is None:
+            with self._status_lock:
+                self._unreported.discard(address)
+            self.first_status()
+
+    def short_poll_seconds(self):
+        """
+        Seconds between shortPolls set in Polyglot for this node server.
+        """
+        try:
+            return float(self.polyConfig['shortPoll'])
+        except (TypeError, KeyError, ValueError):
+            return self.scheduler.default_interval
+
+    def save_snapshot(self):
+        self.snapshot.save(self.nodes)
+
     def shortPoll(self):
         """
         Optional.
@@ -91,9 +288,30 @@ class TemplateController(Controller):
         The timer can be overriden in the server.json.
         """
         LOGGER.debug('shortPoll')
-        for node in self.nodes:
-            if node != self.address:
-                self.nodes[node].shortPoll()
+        start = time.time()
+        # DISCOVER can be adding nodes on a command worker right now
+        nodes = [node for address, node in list(self.nodes.items()) if address != self.address]
+        if self.shards is not None:
+            skip = [node.address for node in nodes if not self.watchdog.due(node)]
+            stats = self.shards.poll('shortPoll', skip=skip)
+            if self.time_to_status is None and not stats['failed'] and not stats['late']:
+                # Their status updates were applied before the workers said done
+                skip = set(skip)
+                for node in nodes:
+                    if self.shards.owns(node.address) and node.address not in skip:
+                        self._reported(node.address)
+            # Nodes of workers that were given up on are polled here
+            nodes = [node for node in nodes if not self.shards.owns(node.address)]
+        if not self.use_poll_scheduler and nodes:
+            # Node polls run in parallel on the poll pool, so the cycle takes as
+            # long as the slowest node instead of the sum of all of them.
+            self.poll_pool.run([node for node in nodes if self.watchdog.due(node)])
+        # The scheduler polls on its own, the watchdog checks the pool backlog for it
+        cycle = self.shards is not None or not self.use_poll_scheduler
+        self.watchdog.check(time.time() - start if cycle else None)
+        if STARTUP.mark('first_poll'):
+            LOGGER.info('Startup: %s', STARTUP.summary())
+        self.report_metrics()
 
     def longPoll(self):
         """
@@ -104,6 +322,18 @@ class TemplateController(Controller):
         """
         LOGGER.debug('longPoll')
         self.heartbeat()
+        self.save_snapshot()
+        self.write_metrics()
+        LOGGER.debug('longPoll: driver batcher %s', self.batcher.stats())
+        LOGGER.debug('longPoll: command queue %s', self.command_queue.stats())
+        LOGGER.debug('longPoll: outbound %s', self.outbound.stats())
+        LOGGER.debug('longPoll: driver filter %s', self.driver_filter.stats())
+        LOGGER.debug('longPoll: response cache %s', self.cache.stats())
+        LOGGER.debug('longPoll: poll watchdog %s', self.watchdog.stats())
+        LOGGER.debug('longPoll: log pipeline %s', LOG_PIPELINE.stats())
+        LOGGER.debug('longPoll: config watcher %s', self.config_watcher.stats())
+        if self.shards is not None:
+            LOGGER.debug('longPoll: shards %s', self.shards.stats())
 
     def query(self,command=None):
         """
@@ -111,18 +341,231 @@ class TemplateController(Controller):
         By default a query to the control node reports the FULL driver set for ALL
         nodes back to ISY. If you override this method you will need to Super or
         issue a reportDrivers() to each node manually.
+        Here only driver values ISY may not have are sent, unless query_mode is
+        'full', then everything is streamed at query_rate. Either way this
+        includes the latest values the driver filter held back.
         """
         self.check_params()
-        for node in self.nodes:
-            self.nodes[node].reportDrivers()
+        if self.query_mode == 'full':
+            self.status()
+            return
+        count = 0
+        for node in list(self.nodes.values()):
+            drivers = node.drivers
+            sent = count
+            for d in drivers:
+                if self.shadow.needs(node.address, d['driver'], d['value'], d['uom']):
+                    self.outbound.put({'status': {'address': node.address, 'driver': d['driver'],
+                                                  'value': str(d['value']), 'uom': d['uom']}}, Outbound.BULK)
+                    count += 1
+            if count > sent:
+                # Filtered changes are compared with what was sent from now on
+                node.updateDrivers(drivers)
+        LOGGER.info('query: sent %d changed or unconfirmed driver values', count)
+
+    def status(self):
+        """
+        Full report of every driver for every node, streamed in the background
+        at query_rate messages per second with the values they have when sent.
+        """
+        self.report_stream.report([
+            (node.address, d['driver']) for node in list(self.nodes.values()) for d in node.drivers
+        ])
+
+    def driver_value(self, address, driver):
+        """
+        Current (value, uom) of a node's driver, None if there is no such node
+        or driver.
+        """
+        node = self.nodes.get(address)
+        if node is None:
+            return None
+        for d in node.drivers:
+            if d['driver'] == driver:
+                return d['value'], d['uom']
+        return None
+
+    def publish(self, message):
+        """
+        Every driver status and heartbeat sent to Polyglot goes through here,
+        called by self.outbound.
+        """
+        with self.metrics.timer('publish'):
+            if 'status' in message:
+                self.shadow.sent(message['status'])
+            self.poly.send(message)
+
+    def reportDriver(self, driver, report, force):
+        """
+        Same as the parent class, but hands the update to self.batcher like
+        the nodes do, so the controller's drivers go out through self.outbound.
+        """
+        for d in self._drivers:
+            if (d['driver'] == driver['driver'] and
+                (str(d['value']) != str(driver['value']) or
+                    d['uom'] != driver['uom'] or
+                    force)):
+                d['value'] = driver['value']
+                d['uom'] = driver['uom']
+                self.batcher.status(self.address, driver['driver'], driver['value'], driver['uom'])
+                break
+
+    def reportDrivers(self):
+        """
+        Same as the parent class, but sends through self.batcher.
+        """
+        self.updateDrivers(self.drivers)
+        for driver in self.drivers:
+            self.batcher.status(self.address, driver['driver'], driver['value'], driver['uom'])
+
+    def reportCmd(self, command, value=None, uom=None):
+        """
+        Same as the parent class, but sent through self.outbound.
+        """
+        message = {'command': {'address': self.address, 'command': command}}
+        if value is not None and uom is not None:
+            message['command']['value'] = str(value)
+            message['command']['uom'] = uom
+        self.outbound.put(message)
 
-    def discover(self, *args, **kwargs):
+    def report_metrics(self):
+        """
+        Show the last poll time, the number of poll overruns and the poll shed
+        level on the controller, sent through self.batcher like node drivers
+        """
+        name = 'node_poll' if self.use_poll_scheduler else 'poll_cycle'
+        self.setDriver('GV2', int(self.metrics.last_ms(name)))
+        self.setDriver('GV3', self.metrics.get('poll_overruns'))
+        self.setDriver('GV4', self.watchdog.level)
+
+    def write_metrics(self):
+        summary = self.metrics.summary()
+        for name, value in self.batcher.stats().items():
+            summary['counters']['batch_' + name] = value
+        summary['counters']['command_rejected'] = self.command_queue.rejected
+        summary['counters']['cache_hit_ratio'] = self.cache.stats()['hit_ratio']
+        summary['counters']['poll_shed_level'] = self.watchdog.level
+        summary['counters']['poll_load'] = round(self.watchdog.load, 2)
+        for driver, count in self.driver_filter.stats().items():
+            summary['counters']['driver_filtered_' + driver] = count
+        for priority, stats in self.outbound.stats().items():
+            for name, value in stats.items():
+                summary['counters']['outbound_%s_%s' % (priority, name)] = value
+        summary['startup'] = STARTUP.phases()
+        Storage(self.metrics_file).save(summary)
+
+    def discover(self, command=None, force=True):
         """
         Example
         Do discovery here. Does not have to be called discovery. Called from example
         controller start method and from DISCOVER command recieved from ISY as an exmaple.
+        The Discovery class does the work, using discover_targets and probe_device
+        below to find the devices.
         """
-        self.addNode(TemplateNode(self, self.address, 'templateaddr', 'Template Node Name'))
+        return self.discovery.run(force=force)
+
+    def discover_targets(self):
+        """
+        Example
+        Return the list of things probe_device should look at, e.g. IP
+        addresses on the local network.
+        """
+        return ['templateaddr']
+
+    def probe_device(self, target):
+        """
+        Example
+        Check one target for a device. Called in parallel for all targets.
+        Return a dictionary with the node address, name and node_def_id for the
+        device, or None if there is nothing there. Raise an exception if the
+        device could not be checked so it isn't removed.
+        """
+        return {'address': target, 'name': 'Template Node Name', 'node_def_id': 'templatenodeid'}
+
+    def addNodes(self, nodes):
+        """
+        Same as addNode, but for a list of nodes which are sent to Polyglot
+        in a single addnode message.
+        """
+        if not nodes:
+            return
+        for node in nodes:
+            self._register_node(node)
+            self.nodesAdding.append(node.address)
+        LOGGER.info('addNodes: adding %d nodes', len(nodes))
+        self.poly.send({
+            'addnode': {
+                'nodes': [{
+                    'address': node.address,
+                    'name': node.name,
+                    'node_def_id': node.id,
+                    'primary': node.primary,
+                    'drivers': node.drivers,
+                    'hint': node.hint
+                } for node in nodes]
+            }
+        })
+
+    def restoreNode(self, node):
+        """
+        Put a node Polyglot already has, unchanged, back in self.nodes without
+        sending it again, and start it. Drivers that differ from what Polyglot
+        has are reported.
+        """
+        self._register_node(node)
+        for driver in node.drivers:
+            node.reportDriver(driver, True, False)
+        node.start()
+
+    def _register_node(self, node):
+        # Pick up the last values Polyglot has for the drivers, like addNode does.
+        if node.address in self._nodes:
+            node._drivers = self._nodes[node.address]['drivers']
+            for driver in node.drivers:
+                for existing in self._nodes[node.address]['drivers']:
+                    if driver['driver'] == existing['driver']:
+                        driver['value'] = existing['value']
+        # Then the values saved on the last run, which may be newer
+        if not self.snapshot.restore(node):
+            self._wait_for_status(node.address)
+        self.nodes[node.address] = node
+        self._poll_node(node)
+
+    def addNode(self, node, update=False):
+        node = super(TemplateController, self).addNode(node, update)
+        if node.address != self.address:
+            self._wait_for_status(node.address)
+            self._poll_node(node)
+        return node
+
+    def _poll_node(self, node):
+        if self.shards is not None:
+            self.shards.add(node)
+        else:
+            self._poll_local(node)
+
+    def _poll_local(self, node):
+        # Polled in this process, also used for nodes of a shard given up on
+        self.scheduler.add(node)
+
+    def delNode(self, address):
+        self.scheduler.remove(address)
+        # A deleted node isn't waited on
+        self._reported(address)
+        if self.shards is not None:
+            self.shards.remove(address)
+        super(TemplateController, self).delNode(address)
+        self.driver_store.remove(address)
+        self.driver_filter.forget(address)
+
+    def node_class(self, node_def_id):
+        """
+        The Class to create nodes of this node_def_id with, its module is
+        imported the first time.
+        """
+        if self.compact_nodes:
+            return load_class(self.compact_node_classes[node_def_id])
+        return load_class(self.node_classes[node_def_id])
 
     def delete(self):
         """
@@ -134,37 +577,69 @@ class TemplateController(Controller):
         LOGGER.info('Oh God I\'m being deleted. Nooooooooooooooooooooooooooooooooooooooooo.')
 
     def stop(self):
+        self.scheduler.stop()
+        if self.shards is not None:
+            self.shards.stop()
+        self.poll_pool.shutdown()
+        # Before the batcher and outbound, so the commands' updates are sent
+        self.command_queue.stop()
+        self.report_stream.stop()
+        self.batcher.stop()
+        LOGGER.info('stop: driver batcher %s', self.batcher.stats())
+        self.outbound.stop()
+        LOGGER.info('stop: outbound %s', self.outbound.stats())
+        if self._http is not None:
+            self._http.clear()
+        self.config_watcher.stop()
+        self.save_snapshot()
+        self.write_metrics()
+        self.metrics.stop()
         LOGGER.debug('NodeServer stopped.')
+        LOG_PIPELINE.stop()
 
-    def process_config(self, config):
-        # this seems to get called twice for every change, why?
-        # What does config represent?
-        LOGGER.info("process_config: Enter config={}".format(config))
-        LOGGER.info("process_config: Exit")
+    def params_changed(self, changes, params):
+        """
+        Custom params were changed on the configuration page, see ConfigWatcher.
+        """
+        LOGGER.info('params_changed: %s', changes)
+        if any(key in changes[kind] for kind in changes for key in ('user', 'password')):
+            # Only the user and password notice depends on the params
+            self.check_params()
+
+    def typed_data_changed(self, changes, data):
+        LOGGER.info('typed_data_changed: %s', changes)
 
     def heartbeat(self,init=False):
-        LOGGER.debug('heartbeat: init={}'.format(init))
+        LOGGER.debug('heartbeat: init=%s',init)
         if init is not False:
             self.hb = init
-        LOGGER.debug('heartbeat: hb={}'.format(self.hb))
-        if self.hb == 0:
-            self.reportCmd("DON",2)
-            self.hb = 1
-        else:
-            self.reportCmd("DOF",2)
-            self.hb = 0
+        LOGGER.debug('heartbeat: hb=%s',self.hb)
+        with self.outbound.priority(Outbound.HEARTBEAT):
+            if self.hb == 0:
+                self.reportCmd("DON",2)
+                self.hb = 1
+            else:
+                self.reportCmd("DOF",2)
+                self.hb = 0
+
+    def runCmd(self, command):
+        """
+        Commands are queued to run on the command queue instead of on the
+        thread reading messages from Polyglot.
+        """
+        self.command_queue.submit(self.address, super(TemplateController, self).runCmd, command)
 
     def set_module_logs(self,level):
         logging.getLogger('urllib3').setLevel(level)
 
     def set_debug_level(self,level):
-        LOGGER.debug('set_debug_level: {}'.format(level))
+        LOGGER.debug('set_debug_level: %s',level)
         if level is None:
             level = 30
         level = int(level)
         if level == 0:
             level = 30
-        LOGGER.info('set_debug_level: Set GV1 to {}'.format(level))
+        LOGGER.info('set_debug_level: Set GV1 to %s',level)
         self.setDriver('GV1', level)
         # 0=All 10=Debug are the same because 0 (NOTSET) doesn't show everything.
         if level <= 10:
@@ -178,7 +653,7 @@ class TemplateController(Controller):
         elif level == 50:
             LOGGER.setLevel(logging.CRITICAL)
         else:
-            LOGGER.debug("set_debug_level: Unknown level {}".format(level))
+            LOGGER.debug("set_debug_level: Unknown level %s",level)
         # this is the best way to control logging for modules, so you can
         # still see warnings and errors
         #if level < 10:
@@ -196,113 +671,123 @@ class TemplateController(Controller):
     def check_params(self):
         """
         This is an example if using custom Params for user and password and an example with a Dictionary
+        Notices and params go through self.reconciler, only what changed is
+        sent to Polyglot on commit() and notices not added here are removed.
         """
-        self.removeNoticesAll()
-        self.addNotice('Hey there, my IP is {}'.format(self.poly.network_interface['addr']),'hello')
-        self.addNotice('Hello Friends! (without key)')
+        self.reconciler.notice('Hey there, my IP is {}'.format(self.poly.network_interface['addr']),'hello')
+        self.reconciler.notice('Hello Friends! (without key)')
         default_user = "YourUserName"
         default_password = "YourPassword"
 
         self.user = self.getCustomParam('user')
         if self.user is None:
             self.user = default_user
-            LOGGER.error('check_params: user not defined in customParams, please add it.  Using {}'.format(self.user))
-            self.addCustomParam({'user': self.user})
+            LOGGER.error('check_params: user not defined in customParams, please add it.  Using %s',self.user)
+            self.reconciler.param('user', self.user, replace=False)
 
         self.password = self.getCustomParam('password')
         if self.password is None:
             self.password = default_password
-            LOGGER.error('check_params: password not defined in customParams, please add it.  Using {}'.format(self.password))
-            self.addCustomParam({'password': self.password})
+            LOGGER.error('check_params: password not defined in customParams, please add it.  Using %s',self.password)
+            self.reconciler.param('password', self.password, replace=False)
 
-        # Always overwrite this, it's just an example...
-        self.addCustomParam({'some_example': '{ "type": "TheType", "host": "host_or_IP", "port": "port_number" }'})
+        # Always overwrite this, it's just an example... but only if it's different
+        self.reconciler.param('some_example', '{ "type": "TheType", "host": "host_or_IP", "port": "port_number" }')
 
         # Add a notice if they need to change the user/password from the default.
         if self.user == default_user or self.password == default_password:
-            # This doesn't pass a key to test the old way.
-            self.addNotice('Please set proper user and password in configuration page, and restart this nodeserver')
-        # This one passes a key to test the new way.
-        self.addNotice('This is a test','test')
-        self.poly.save_typed_params(
-            [
-                {
-                    'name': 'item',
-                    'title': 'Item',
-                    'desc': 'Description of Item',
-                    'isList': False,
-                    'params': [
-                        {
-                            'name': 'id',
-                            'title': 'The Item ID',
-                            'isRequired': True,
-                        },
-                        {
-                            'name': 'title',
-                            'title': 'The Item Title',
-                            'defaultValue': 'The Default Title',
-                            'isRequired': True,
-                        },
-                        {
-                            'name': 'extra',
-                            'title': 'The Item Extra Info',
-                            'isRequired': False,
-                        }
-                    ]
-                },
-                {
-                    'name': 'itemlist',
-                    'title': 'Item List',
-                    'desc': 'Description of Item List',
-                    'isList': True,
-                    'params': [
-                        {
-                            'name': 'id',
-                            'title': 'The Item ID',
-                            'isRequired': True,
-                        },
-                        {
-                            'name': 'title',
-                            'title': 'The Item Title',
-                            'defaultValue': 'The Default Title',
-                            'isRequired': True,
-                        },
-                        {
-                            'name': 'names',
-                            'title': 'The Item Names',
-                            'isRequired': False,
-                            'isList': True,
-                            'defaultValue': ['somename']
-                        },
-                        {
-                            'name': 'extra',
-                            'title': 'The Item Extra Info',
-                            'isRequired': False,
-                            'isList': True,
-                        }
-                    ]
-                },
-            ]
-        )
+            # This doesn't pass a key, the reconciler makes one from the text.
+            self.reconciler.notice('Please set proper user and password in configuration page, and restart this nodeserver')
+        # This one passes a key.
+        self.reconciler.notice('This is a test','test')
+        self.reconciler.commit()
+        typed_params = [
+            {
+                'name': 'item',
+                'title': 'Item',
+                'desc': 'Description of Item',
+                'isList': False,
+                'params': [
+                    {
+                        'name': 'id',
+                        'title': 'The Item ID',
+                        'isRequired': True,
+                    },
+                    {
+                        'name': 'title',
+                        'title': 'The Item Title',
+                        'defaultValue': 'The Default Title',
+                        'isRequired': True,
+                    },
+                    {
+                        'name': 'extra',
+                        'title': 'The Item Extra Info',
+                        'isRequired': False,
+                    }
+                ]
+            },
+            {
+                'name': 'itemlist',
+                'title': 'Item List',
+                'desc': 'Description of Item List',
+                'isList': True,
+                'params': [
+                    {
+                        'name': 'id',
+                        'title': 'The Item ID',
+                        'isRequired': True,
+                    },
+                    {
+                        'name': 'title',
+                        'title': 'The Item Title',
+                        'defaultValue': 'The Default Title',
+                        'isRequired': True,
+                    },
+                    {
+                        'name': 'names',
+                        'title': 'The Item Names',
+                        'isRequired': False,
+                        'isList': True,
+                        'defaultValue': ['somename']
+                    },
+                    {
+                        'name': 'extra',
+                        'title': 'The Item Extra Info',
+                        'isRequired': False,
+                        'isList': True,
+                    }
+                ]
+            },
+        ]
+        # Only send them if Polyglot doesn't have them already
+        if self.poly.config.get('typedParams') != typed_params:
+            self.poly.save_typed_params(typed_params)
 
     def remove_notice_test(self,command):
-        LOGGER.info('remove_notice_test: notices={}'.format(self.poly.config['notices']))
+        LOGGER.info('remove_notice_test: notices=%s',self.poly.config['notices'])
         # Remove all existing notices
         self.removeNotice('test')
 
     def remove_notices_all(self,command):
-        LOGGER.info('remove_notices_all: notices={}'.format(self.poly.config['notices']))
+        LOGGER.info('remove_notices_all: notices=%s',self.poly.config['notices'])
         # Remove all existing notices
         self.removeNoticesAll()
 
     def update_profile(self,command):
         LOGGER.info('update_profile:')
-        st = self.poly.installprofile()
-        return st
+        # Installs only if the generated profile changed
+        return self.check_profile(force=True)
+
+    def cmd_profile(self,command):
+        """
+        Profile node polls and commands with cProfile for the number of seconds
+        given, the result is written to logs/ and the top functions are logged.
+        """
+        self.metrics.profile(int(command.get('value', 60)))
 
     def cmd_set_debug_mode(self,command):
         val = int(command.get('value'))
-        LOGGER.debug("cmd_set_debug_mode: {}".format(val))
+        LOGGER.debug("cmd_set_debug_mode: %s",val)
         self.set_debug_level(val)
 
     """
@@ -316,6 +801,119 @@ class TemplateController(Controller):
     In the nodedefs.xml
     """
     id = 'controller'
+    """
+    Maximum number of node polls running at the same time, and the seconds a
+    single node poll may take before the cycle stops waiting on it.
+    """
+    poll_workers = 8
+    poll_deadline = 30
+    """
+    When polls don't keep up the watchdog polls nodes with a low
+    poll_priority less often until they do, and shows the shed level in GV4.
+    Load is the poll cycle time over the time between cycles, or with the
+    scheduler the polls waiting over poll_workers. See nodes/PollWatchdog.py
+    """
+    poll_watchdog = {
+        'max_level': 3,
+        'overrun': 0.9,
+        'recover': 0.5,
+        'recover_checks': 3,
+        'hung': 120,
+    }
+    """
+    With use_poll_scheduler each node is polled on its own interval, which
+    starts at poll_interval seconds, or the shortPoll set in Polyglot when it
+    is None, and adapts between the node class poll_min_interval and
+    poll_max_interval. Otherwise all nodes are polled on shortPoll. The
+    heartbeat always runs on longPoll.
+    """
+    use_poll_scheduler = False
+    poll_interval = None
+    """
+    Seconds node driver updates are collected before they are sent, 0 to send
+    each one immediately.
+    """
+    driver_batch_window = 0.5
+    """
+    Messages per second sent to ISY and how many can go at once, see
+    nodes/Outbound.py. None for no limit.
+    """
+    outbound_rate = 20
+    outbound_burst = 40
+    """
+    Seconds without a new config from Polyglot before config changes are
+    handled, see params_changed()
+    """
+    config_debounce = 1.0
+    """
+    QUERY sends only changed or unconfirmed values in 'delta' mode, or all of
+    them in 'full' mode. Full reports are sent at query_rate messages per second.
+    """
+    query_mode = 'delta'
+    query_rate = 20
+    """
+    Settings for the shared HTTP connection pool, see nodes/HttpPool.py
+    """
+    http_pool = {
+        'num_pools': 10,
+        'maxsize': 4,
+        'retries': 3,
+        'backoff_factor': 0.5,
+        'connect_timeout': 5.0,
+        'read_timeout': 10.0,
+    }
+    """
+    Seconds device responses are reused for and how many are kept, see
+    nodes/ResponseCache.py
+    """
+    response_cache = {
+        'ttl': 5,
+        'maxsize': 1000,
+    }
+    """
+    Number of ISY commands that can run at the same time, and how many can be
+    waiting before new ones are held back.
+    """
+    command_workers = 4
+    command_queue_size = 100
+    """
+    Number of worker processes node polls and commands run in, 0 runs them
+    all in this process. Workers create the nodes from compact_node_classes,
+    use it when polls are CPU heavy and one core isn't enough.
+    """
+    shard_workers = 0
+    """
+    File the discovered devices are saved in, and how many seconds it is used
+    on restart instead of discovering again.
+    """
+    inventory_file = 'inventory.json'
+    inventory_max_age = 86400
+    """
+    Node classes by node_def_id, used to create the nodes discovery finds.
+    Give them as 'module.Class' so a module is only imported once a node of
+    one of its classes is created, classes work too.
+    """
+    node_classes = {
+        'templatenodeid': 'nodes.TemplateNode.TemplateNode',
+    }
+    """
+    With compact_nodes the classes in compact_node_classes are used instead,
+    they keep driver values in self.driver_store and use less memory per node.
+    """
+    compact_nodes = False
+    compact_node_classes = {
+        'templatenodeid': 'nodes.TemplateNode.CompactTemplateNode',
+    }
+    """
+    File node state and profile source hashes are saved in on longPoll and stop
+    """
+    snapshot_file = 'snapshot.json'
+    """
+    Metrics are written to metrics_file on longPoll, and served as JSON on
+    http://127.0.0.1:metrics_port/ if it is set.
+    """
+    metrics_file = 'logs/metrics.json'
+    metrics_port = None
     commands = {
         'QUERY': query,
         'DISCOVER': discover,
@@ -323,8 +921,52 @@ class TemplateController(Controller):
         'REMOVE_NOTICES_ALL': remove_notices_all,
         'REMOVE_NOTICE_TEST': remove_notice_test,
         'SET_DM': cmd_set_debug_mode,
+        'PROFILE': cmd_profile,
     }
     drivers = [
         {'driver': 'ST', 'value': 1, 'uom': 2},
         {'driver': 'GV1', 'value': 10, 'uom': 25}, # Debug (Log) Mode, default=30=Warning
+        {'driver': 'GV2', 'value': 0, 'uom': 42}, # Last poll time in milliseconds
+        {'driver': 'GV3', 'value': 0, 'uom': 56}, # Poll overruns since start
+        {'driver': 'GV4', 'value': 0, 'uom': 25}, # Poll shed level, 0=Normal
     ]
+    """
+    Editors and names for the profile generated from drivers and commands,
+    see nodes/ProfileBuilder.py. Editors are in profile/editor/editors.xml
+    """
+    profile = {
+        'nls': 'ctl',
+        'name': 'Template NodeServer Controller',
+        'drivers': {
+            'ST': {'editor': 'bool', 'name': 'NodeServer Online'},
+            'GV1': {'editor': 'I_DEBUG', 'name': 'Logger Level'},
+            'GV2': {'editor': 'I_MS', 'name': 'Last Poll ms'},
+            'GV3': {'editor': 'I_COUNT', 'name': 'Poll Overruns'},
+            'GV4': {'editor': 'I_SHED', 'name': 'Poll Load Shedding'},
+        },
+        'commands': {
+            'QUERY': {'name': 'Query'},
+            'DISCOVER': {'name': 'Re-Discover'},
+            'UPDATE_PROFILE': {'name': 'Update Profile'},
+            'REMOVE_NOTICES_ALL': {'name': 'Remove All Notices'},
+            'REMOVE_NOTICE_TEST': {'name': 'Remove Notice Test'},
+            'SET_DM': {'name': 'Set Logger Level', 'editor': 'I_DEBUG', 'init': 'GV1'},
+            'PROFILE': {'name': 'Profile Seconds', 'editor': 'I_SECONDS'},
+        },
+        # These are for our heartbeat
+        'sends': ['DON', 'DOF'],
+        # Debug/Logger Modes
+        'strings': [
+            ('CDM-9', 'Debug + Modules'),
+            ('CDM-10', 'Debug'),
+            ('CDM-20', 'Info'),
+            ('CDM-30', 'Warning'),
+            ('CDM-40', 'Error'),
+            ('CDM-50', 'Critical'),
+            # Poll shed levels
+            ('SHED-0', 'Normal'),
+            ('SHED-1', 'Shedding Low Priority'),
+            ('SHED-2', 'Shedding More'),
+            ('SHED-3', 'Shedding Most'),
+        ],
+    }
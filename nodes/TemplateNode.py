@@ -5,7 +5,8 @@ except ImportError:
     import pgc_interface as polyinterface
 import sys
 import time
-import urllib3
+from nodes.CompactNode import CompactNode
+from nodes.DriverFilter import DriverFilter
 
 LOGGER = polyinterface.LOGGER
 
@@ -27,6 +28,7 @@ class TemplateNode(polyinterface.Node):
         Polyglot/ISY. If force is True, we send a report even if the value hasn't changed.
     reportDrivers(): Forces a full update of all drivers to Polyglot/ISY.
     query(): Called when ISY sends a query request to Polyglot for this specific node
+    get_device(url): Cached GET request to the device, see nodes/ResponseCache.py
     """
     def __init__(self, controller, primary, address, name):
         """
@@ -40,7 +42,13 @@ class TemplateNode(polyinterface.Node):
         :param name: This nodes name
         """
         super(TemplateNode, self).__init__(controller, primary, address, name)
-        self.lpfx = '%s:%s' % (address,name)
+        if DriverFilter.settings(type(self)):
+            # The filter settings stay on the class, Polyglot gets driver, value and uom
+            self.drivers = DriverFilter.strip(self.drivers)
+
+    @property
+    def lpfx(self):
+        return '%s:%s' % (self.address,self.name)
 
     def start(self):
         """
@@ -57,7 +65,6 @@ class TemplateNode(polyinterface.Node):
         LOGGER.debug('%s: get ST=%s',self.lpfx,self.getDriver('ST'))
         self.setDriver('ST', 0)
         LOGGER.debug('%s: get ST=%s',self.lpfx,self.getDriver('ST'))
-        self.http = urllib3.PoolManager()
 
     def shortPoll(self):
         LOGGER.debug('shortPoll')
@@ -70,6 +77,45 @@ class TemplateNode(polyinterface.Node):
     def longPoll(self):
         LOGGER.debug('longPoll')
 
+    def reportDriver(self, driver, report, force):
+        """
+        Same as the parent class, but hands the update to the controller's
+        batcher instead of sending it to Polyglot right away. Changes the
+        driver's deadband, hysteresis or min_interval settings filter out
+        are not reported, see nodes/DriverFilter.py
+        """
+        for d in self._drivers:
+            if (d['driver'] == driver['driver'] and
+                (str(d['value']) != str(driver['value']) or
+                    d['uom'] != driver['uom'] or
+                    force)):
+                if not (force or d['uom'] != driver['uom'] or
+                        self.controller.driver_filter.allow(self, d['driver'], d['value'], driver['value'])):
+                    break
+                d['value'] = driver['value']
+                d['uom'] = driver['uom']
+                self.controller.batcher.status(self.address, driver['driver'], driver['value'], driver['uom'])
+                break
+
+    def reportDrivers(self):
+        """
+        Same as the parent class, but sends through the controller's batcher.
+        """
+        self.updateDrivers(self.drivers)
+        for driver in self.drivers:
+            self.controller.batcher.status(self.address, driver['driver'], driver['value'], driver['uom'])
+
+    def runCmd(self, command):
+        """
+        Commands are queued on the controller's command queue so a slow one,
+        like cmd_ping, doesn't hold up commands for other nodes. With the
+        controller's shard_workers the command runs in the node's worker.
+        """
+        shards = self.controller.shards
+        if shards is not None and shards.owns(self.address):
+            return shards.command(self.address, command)
+        self.controller.command_queue.submit(self.address, super(TemplateNode, self).runCmd, command)
+
     def cmd_on(self, command):
         """
         Example command received from ISY.
@@ -92,8 +138,17 @@ class TemplateNode(polyinterface.Node):
         in a module...
         """
         LOGGER.debug("cmd_ping:")
-        r = self.http.request('GET',"google.com")
-        LOGGER.debug("cmd_ping: r={}".format(r))
+        r = self.get_device("google.com")
+        LOGGER.debug("cmd_ping: r=%s",r)
+
+    def get_device(self, url):
+        """
+        GET url from the device with a connection from the controller's shared
+        pool. The response is reused for a few seconds by polls, queries and
+        commands, and callers asking at the same time share one request.
+        Call self.controller.cache.invalidate(url) after changing the device.
+        """
+        return self.controller.cache.get(url, lambda: self.controller.http.request('GET', url))
 
 
     def query(self,command=None):
@@ -104,6 +159,21 @@ class TemplateNode(polyinterface.Node):
         """
         self.reportDrivers()
 
+    poll_min_interval = None
+    poll_max_interval = 600
+    """
+    Seconds between shortPoll calls when the controller's poll scheduler is
+    used. Polls speed up towards the min while values keep changing, and slow
+    down towards the max while they don't. Without a min they never run more
+    often than the controller's poll interval, set one to let a node with
+    fast changing values be polled faster.
+    """
+    poll_priority = 0
+    """
+    Nodes with a lower poll_priority are polled less often first when the
+    controller's poll watchdog sheds load. Nodes with a poll_priority of 3,
+    the watchdog's max_level, keep their polls.
+    """
     "Hints See: https://github.com/UniversalDevicesInc/hints"
     hint = [1,2,3,4]
     drivers = [{'driver': 'ST', 'value': 0, 'uom': 2}]
@@ -113,12 +183,26 @@ class TemplateNode(polyinterface.Node):
     values and uoms(units of measure) from ISY. This is how ISY knows what kind
     of variable to display. Check the UOM's in the WSDK for a complete list.
     UOM 2 is boolean so the ISY will display 'True/False'
+    Noisy values can have deadband, hysteresis and min_interval settings so
+    only changes that matter are reported, e.g.
+    {'driver': 'CLITEMP', 'value': 0, 'uom': 17, 'deadband': 0.5, 'min_interval': 60}
+    See nodes/DriverFilter.py
     """
     id = 'templatenodeid'
     """
     id of the node from the nodedefs.xml that is in the profile.zip. This tells
     the ISY what fields and commands this node has.
     """
+    profile = {
+        'nls': 'tmplnode',
+        'name': 'Template Node',
+        'drivers': {'ST': {'editor': 'bool', 'name': 'Node Status'}},
+        'commands': {'PING': {'name': 'Ping'}},
+    }
+    """
+    Editors and names for the nodedefs.xml and en_us.txt generated from the
+    drivers and commands, see nodes/ProfileBuilder.py
+    """
     commands = {
                     'DON': cmd_on,
                     'DOF': cmd_off,
@@ -128,3 +212,10 @@ class TemplateNode(polyinterface.Node):
     This is a dictionary of commands. If ISY sends a command to the NodeServer,
     this tells it which method to call. DON calls setOn, etc.
     """
+
+class CompactTemplateNode(CompactNode, TemplateNode):
+    """
+    TemplateNode using slots and the controller's DriverStore, for servers with
+    thousands of nodes. See nodes/CompactNode.py
+    """
+    __slots__ = ()
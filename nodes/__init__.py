@@ -1,5 +1,7 @@
-
 """ Node classes used by the Wireless Sensor Tags Node Server. """
 
-from .TemplateNode            import TemplateNode
+# Only the controller is imported with the package. Node classes are loaded
+# when the first node of their node_def_id is created, see
+# TemplateController.node_classes, and everything else is imported from its
+# module where it's used, e.g. from nodes.Outbound import Outbound
 from .TemplateController      import TemplateController
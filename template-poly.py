@@ -3,6 +3,12 @@
 This is a NodeServer template for Polyglot v2 written in Python2/3
 by Einstein.42 (James Milne) milne.james@gmail.com
 """
+import time
+STARTED = time.time()
+"""
+Startup phases are timed from here, before anything slow is imported. The
+time each phase took is logged after the first poll, see nodes/StartupTimer.py
+"""
 try:
     import polyinterface
 except ImportError:
@@ -31,6 +37,9 @@ You can use LOGGER.info, LOGGER.warning, LOGGER.debug, LOGGER.error levels as ne
 
 """ Grab My Controller Node """
 from nodes import TemplateController
+from nodes.StartupTimer import STARTUP
+STARTUP.started = STARTED
+STARTUP.mark('import')
 
 if __name__ == "__main__":
     try:
@@ -42,6 +51,7 @@ if __name__ == "__main__":
         where N is the slot number.
         """
         polyglot.start()
+        STARTUP.mark('interface')
         """
         Starts MQTT and connects to Polyglot.
         """
@@ -60,5 +70,5 @@ if __name__ == "__main__":
         """
         polyglot.stop()
     except Exception as err:
-        LOGGER.error('Excption: {0}'.format(err), exc_info=True)
+        LOGGER.error('Excption: %s', err, exc_info=True)
     sys.exit(0)